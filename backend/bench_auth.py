@@ -0,0 +1,79 @@
+"""Per-request authentication overhead, with and without the auth caches.
+
+Creates a benchmark user if needed, issues a token and times
+`get_current_user` directly and a protected endpoint end to end. "cold" clears
+the token and user caches before every call, which is what every request cost
+before the caches existed; "warm" is a repeat caller.
+
+Usage:
+    DATABASE_URL=sqlite:///./bench.db python bench_auth.py [--requests 500]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import timedelta
+import numpy as np
+from fastapi.testclient import TestClient
+import database, migrations, models
+from main import app
+from routers import auth
+
+BENCH_USER = "bench_auth_user"
+
+def _ensure_user():
+    migrations.run(database.engine)
+    db = database.SessionLocal()
+    try:
+        if db.query(models.User).filter(models.User.username == BENCH_USER).first() is None:
+            # Never logs in, so no real password hash is needed
+            db.add(models.User(username=BENCH_USER, hashed_password="!"))
+            db.commit()
+    finally:
+        db.close()
+
+def _clear_caches():
+    auth._token_cache.clear()
+    auth._user_cache.clear()
+
+def _time_us(fn, n, cold):
+    timings = []
+    for _ in range(n):
+        if cold:
+            _clear_caches()
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return {"p50_us": float(np.median(timings)), "p99_us": float(np.percentile(timings, 99))}
+
+def run(n_requests=500):
+    _ensure_user()
+    token = auth.create_access_token({"sub": BENCH_USER}, expires_delta=timedelta(minutes=30))
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    loop = asyncio.new_event_loop()
+
+    def dependency():
+        loop.run_until_complete(auth.get_current_user(token))
+
+    def endpoint():
+        response = client.get("/predict/cache", headers=headers)
+        response.raise_for_status()
+
+    report = {}
+    for name, fn in (("get_current_user", dependency), ("GET /predict/cache", endpoint)):
+        fn()  # warm up
+        report[name] = {
+            "cold": _time_us(fn, n_requests, cold=True),
+            "warm": _time_us(fn, n_requests, cold=False),
+        }
+    loop.close()
+    report["cache_stats"] = auth.auth_cache_stats()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark authentication overhead.")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests), indent=2))
@@ -0,0 +1,73 @@
+"""Latency benchmark for per-prediction Shapley explanations.
+
+Times `TreeExplainer` on the served model for a single row (the /predict/ and
+/predict/simulate path) and for batches, checks that attributions add up to
+the predicted probability and exits non-zero if the median per-row latency of
+any case exceeds the budget.
+
+Usage:
+    python bench_explain.py [--budget-ms 2.0] [--repeat 200]
+"""
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import ml_service
+
+def _per_row_ms(fn, X, repeat):
+    fn(X)  # warm up
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - t0) * 1000 / len(X))
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def run(budget_ms=2.0, repeat=200, batch_sizes=(1, 100, 5000)):
+    bundle = ml_service.get_bundle()
+    explainer = getattr(bundle, "explainer", None)
+    if explainer is None:
+        raise SystemExit(f"Model {bundle.version} has no Shapley explainer (mock or sklearn fallback)")
+
+    t0 = time.perf_counter()
+    type(explainer)(bundle.engine)
+    build_seconds = time.perf_counter() - t0
+
+    X = ml_service._probe_features(max(batch_sizes), seed=1)
+    phi = explainer.shap_values(X)
+    additivity_error = np.abs(phi.sum(axis=1) + explainer.expected_value - bundle.engine.predict_proba(X)).max()
+
+    results = []
+    for n in batch_sizes:
+        # Fewer repeats for large batches; each one already covers many rows
+        reps = max(3, repeat // n)
+        p50, p99 = _per_row_ms(explainer.shap_values, X[:n], reps)
+        results.append({"rows": n, "p50_ms_per_row": p50, "p99_ms_per_row": p99})
+
+    # End to end single prediction with explanation, as served by /predict/
+    row = X[0]
+    p50, p99 = _per_row_ms(lambda _: bundle.predict_risk(*row), X[:1], repeat)
+    results.append({"rows": "predict_risk", "p50_ms_per_row": p50, "p99_ms_per_row": p99})
+
+    return {
+        "model_version": bundle.version,
+        "n_trees": explainer.n_trees,
+        "n_leaves": explainer.n_leaves,
+        "table_mb": explainer.nbytes / 1e6,
+        "build_seconds": build_seconds,
+        "max_additivity_error": float(additivity_error),
+        "budget_ms": budget_ms,
+        "results": results,
+        "within_budget": all(r["p50_ms_per_row"] < budget_ms for r in results),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-prediction explanations.")
+    parser.add_argument("--budget-ms", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    report = run(args.budget_ms, args.repeat)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["within_budget"] else 1)
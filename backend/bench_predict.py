@@ -0,0 +1,70 @@
+"""Latency benchmark for single-row predictions.
+
+Times the served model on one row at a time, the path /predict/ and
+/predict/simulate take: the flat tree engine alone, the Shapley explanation,
+`predict_risk` end to end and a what-if cache hit. Exits non-zero if the
+median engine latency exceeds the budget.
+
+The engine walks all trees in lock-step, one level per step, so a row costs
+about max_depth times a few NumPy calls whatever the number of trees; see
+`tree_engine.FlatForest._apply_row`.
+
+Usage:
+    python bench_predict.py [--budget-us 200] [--repeat 2000]
+"""
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import ml_service
+
+def _latency_us(fn, repeat):
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def run(budget_us=200.0, repeat=2000):
+    bundle = ml_service.get_bundle()
+    engine = getattr(bundle, "engine", None)
+    if engine is None:
+        raise SystemExit(f"Model {bundle.version} has no flat tree engine (mock or sklearn fallback)")
+
+    gpa, attendance, assignments, income, education = ml_service._probe_features(1, seed=1)[0]
+    row = np.array([gpa, attendance, assignments, income, education], dtype=np.float32)
+    cases = {
+        "engine": lambda: engine.predict_proba(row),
+        "predict_risk": lambda: bundle.predict_risk(gpa, attendance, assignments, income, education),
+        "predict_risk_cached": lambda: ml_service.predict_risk_cached(gpa, attendance, assignments, income, education),
+    }
+    if bundle.explainer is not None:
+        cases["explain"] = lambda: bundle.explainer.explain(row[np.newaxis, :])
+
+    results = []
+    for name, fn in cases.items():
+        p50, p99 = _latency_us(fn, repeat)
+        results.append({"case": name, "p50_us": p50, "p99_us": p99})
+
+    return {
+        "model_version": bundle.version,
+        "format": bundle.format,
+        "n_trees": engine.n_trees,
+        "max_depth": engine.max_depth,
+        "budget_us": budget_us,
+        "results": results,
+        "within_budget": results[0]["p50_us"] < budget_us,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-row predictions.")
+    parser.add_argument("--budget-us", type=float, default=200.0)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    report = run(args.budget_us, args.repeat)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["within_budget"] else 1)
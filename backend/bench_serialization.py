@@ -0,0 +1,138 @@
+"""Serialization cost of the list endpoints, per 10k rows.
+
+Seeds a throwaway SQLite database and times two ways of turning a query into
+a JSON body:
+
+    orm:  ORM objects -> response_model validation -> jsonable_encoder -> json
+          (how /students/ and /students/{id}/predictions used to respond; the
+          contributions were a JSON string embedded in the JSON)
+    rows: column tuples -> dicts -> response_model serialization (the current
+          path: pydantic validates and encodes to JSON in one pass)
+
+Usage:
+    python bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def _setup(db_path, n_rows):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    import database, generate_data, migrations, models
+    import contributions as contributions_store
+
+    migrations.run(database.engine)
+    db = database.SessionLocal()
+    try:
+        generate_data.write_db([generate_data.generate_chunk(0, n_rows, seed=0)], db)
+        names = ("gpa", "attendance_rate", "assignments_completed", "household_income_bracket", "parent_education_level")
+        schema_id = contributions_store.schema_id(names)
+        started = datetime(2026, 1, 1)
+        db.bulk_insert_mappings(models.Prediction, [
+            {
+                "student_id": 1,
+                "risk_level": "Medium",
+                "probability": 0.5,
+                "timestamp": started + timedelta(minutes=i),
+                "model_version": "bench",
+                "contributions_packed": contributions_store.pack([0.1, -0.2, 0.05, 0.0, 0.01]),
+                "feature_schema_id": schema_id,
+            }
+            for i in range(n_rows)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def _json_body(content):
+    # What JSONResponse renders
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+def _time_ms(fn, repeat):
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return min(timings), len(body)
+
+def run(n_rows=10_000, repeat=5):
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    import database, models, schemas
+    import contributions as contributions_store
+    from routers.students import EXPORT_COLUMNS
+
+    students = TypeAdapter(List[schemas.Student])
+    predictions = TypeAdapter(List[schemas.Prediction])
+    prediction_columns = [
+        models.Prediction.id, models.Prediction.timestamp, models.Prediction.risk_level,
+        models.Prediction.probability, models.Prediction.model_version, models.Prediction.contributions_packed,
+        models.Prediction.feature_schema_id, models.Prediction.feature_contributions_json,
+    ]
+
+    def students_orm():
+        with database.SessionLocal() as db:
+            objects = db.scalars(select(models.Student).order_by(models.Student.id).limit(n_rows)).all()
+            validated = students.validate_python(objects, from_attributes=True)
+            return _json_body(jsonable_encoder(validated))
+
+    def students_rows():
+        with database.SessionLocal() as db:
+            columns = [getattr(models.Student, name) for name in EXPORT_COLUMNS]
+            rows = db.execute(select(*columns).order_by(models.Student.id).limit(n_rows)).all()
+            return students.dump_json(students.validate_python([dict(zip(EXPORT_COLUMNS, row)) for row in rows]))
+
+    def predictions_orm():
+        with database.SessionLocal() as db:
+            objects = db.scalars(select(models.Prediction).order_by(models.Prediction.id).limit(n_rows)).all()
+            # The old schema carried the contributions as JSON text
+            content = [
+                {**item, "feature_contributions": json.dumps(item["feature_contributions"])}
+                for item in jsonable_encoder(predictions.validate_python(objects, from_attributes=True))
+            ]
+            return _json_body(content)
+
+    def predictions_rows():
+        with database.SessionLocal() as db:
+            rows = db.execute(select(*prediction_columns).order_by(models.Prediction.id).limit(n_rows)).all()
+            return predictions.dump_json(predictions.validate_python([
+                {
+                    "id": prediction_id, "timestamp": timestamp, "risk_level": risk_level,
+                    "probability": probability, "model_version": model_version,
+                    "feature_contributions": contributions_store.decode(packed, schema_id, legacy_json),
+                }
+                for prediction_id, timestamp, risk_level, probability, model_version, packed, schema_id, legacy_json in rows
+            ]))
+
+    per_10k = 10_000 / n_rows
+    report = {"rows": n_rows}
+    for name, before, after in (
+        ("students", students_orm, students_rows),
+        ("predictions", predictions_orm, predictions_rows),
+    ):
+        before_ms, before_bytes = _time_ms(before, repeat)
+        after_ms, after_bytes = _time_ms(after, repeat)
+        report[name] = {
+            "orm_ms_per_10k": before_ms * per_10k,
+            "rows_ms_per_10k": after_ms * per_10k,
+            "speedup": before_ms / after_ms,
+            "orm_bytes": before_bytes,
+            "rows_bytes": after_bytes,
+        }
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(prefix="earlywarn-bench-"), "bench.db")
+    _setup(db_path, args.rows)
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
@@ -0,0 +1,98 @@
+"""Feature contributions packed as float32 blobs, ordered by a feature schema stored once and referenced by id."""
+import json
+import threading
+import numpy as np
+from sqlalchemy import select
+import database, models
+
+DTYPE = np.dtype("<f4")
+
+_lock = threading.Lock()
+_ids = {}    # tuple of names -> schema id
+_names = {}  # schema id -> tuple of names
+
+def _remember(schema_id, names):
+    with _lock:
+        _ids[names] = schema_id
+        _names[schema_id] = names
+
+def pack(values):
+    return np.asarray(values, dtype=DTYPE).tobytes()
+
+def pack_rows(matrix):
+    """One blob per row of an (n, F) array."""
+    data = np.ascontiguousarray(matrix, dtype=DTYPE)
+    raw, width = data.tobytes(), data.shape[1] * DTYPE.itemsize
+    return [raw[start:start + width] for start in range(0, len(raw), width)]
+
+def unpack(blob, names):
+    return dict(zip(names, np.frombuffer(blob, dtype=DTYPE).tolist()))
+
+def cached_schema_id(names):
+    return _ids.get(tuple(names))
+
+def _find_or_create(names, conn):
+    key = json.dumps(list(names))
+    # Concurrent writers may race to create it; whoever loses reads the winner's row
+    insert = database.dialect_insert(conn)(models.FeatureSchema).values(feature_names=key)
+    conn.execute(insert.on_conflict_do_nothing())
+    return conn.execute(select(models.FeatureSchema.id).where(models.FeatureSchema.feature_names == key)).scalar_one()
+
+def schema_id(names, conn=None):
+    """Id of the feature schema for `names` (in order), created on first use.
+
+    Without `conn` the row is created in its own committed transaction and the
+    id is cached. With `conn` (migrations) it joins the caller's transaction,
+    which may still roll back, so the id is not cached.
+    """
+    names = tuple(names)
+    cached = _ids.get(names)
+    if cached is not None:
+        return cached
+    if conn is not None:
+        return _find_or_create(names, conn)
+    with database.engine.begin() as conn:
+        found = _find_or_create(names, conn)
+    _remember(found, names)
+    return found
+
+def resolve(db, schema_ids):
+    """Cache the names of `schema_ids`, reading the ones not cached yet on `db`.
+
+    Async handlers call this through `run_sync` before decoding, so decoding
+    never opens a blocking connection on the event loop.
+    """
+    missing = {schema_id for schema_id in schema_ids if schema_id is not None and schema_id not in _names}
+    if missing:
+        for schema_id, key in db.execute(
+            select(models.FeatureSchema.id, models.FeatureSchema.feature_names).where(models.FeatureSchema.id.in_(missing))
+        ):
+            _remember(schema_id, tuple(json.loads(key)))
+
+def preload():
+    """Cache every stored schema; run at startup. There are only a handful."""
+    with database.engine.connect() as conn:
+        for schema_id, key in conn.execute(select(models.FeatureSchema.id, models.FeatureSchema.feature_names)):
+            _remember(schema_id, tuple(json.loads(key)))
+
+def feature_names(schema_id):
+    """Names of a stored schema; looked up once per process, then cached."""
+    names = _names.get(schema_id)
+    if names is None:
+        with database.engine.connect() as conn:
+            key = conn.execute(
+                select(models.FeatureSchema.feature_names).where(models.FeatureSchema.id == schema_id)
+            ).scalar_one_or_none()
+        if key is None:
+            raise KeyError(f"Unknown feature schema {schema_id}")
+        names = tuple(json.loads(key))
+        _remember(schema_id, names)
+    return names
+
+def decode(packed, schema_id, legacy_json=None):
+    """{feature: contribution} from a packed blob, or from legacy JSON text."""
+    if packed is not None:
+        return unpack(packed, feature_names(schema_id))
+    if legacy_json:
+        return json.loads(legacy_json)
+    return {}
@@ -1,24 +1,114 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from instrumentation import stage
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./earlywarn.db")
 
+# Pool settings (ignored for in-memory SQLite, which uses a single connection)
+POOL_SIZE = int(os.getenv("EARLYWARN_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("EARLYWARN_DB_MAX_OVERFLOW", "20"))
+POOL_RECYCLE = int(os.getenv("EARLYWARN_DB_POOL_RECYCLE", "1800"))
+POOL_TIMEOUT = float(os.getenv("EARLYWARN_DB_POOL_TIMEOUT", "30"))
+
+# SQLite tuning: WAL lets readers run alongside the single writer, and writers
+# wait for the lock instead of failing with "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("EARLYWARN_SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("EARLYWARN_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("EARLYWARN_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("EARLYWARN_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+def _async_url(url):
+    """Async driver URL for a sync database URL (sqlite -> aiosqlite, postgresql -> asyncpg)."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url[len("postgresql+psycopg2://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+
+def _is_sqlite(url):
+    return url.startswith("sqlite")
+
+def _is_memory(url):
+    return _is_sqlite(url) and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+def _engine_options(url):
+    if _is_memory(url):
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_pre_ping": not _is_sqlite(url),
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
 connect_args = {}
 if "sqlite" in SQLALCHEMY_DATABASE_URL:
-    connect_args = {"check_same_thread": False}
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **_engine_options(SQLALCHEMY_DATABASE_URL)
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the request handlers; sync helpers (scoring, ingest, jobs)
+# keep using `engine`, or are called through `AsyncSession.run_sync`
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000} if _is_sqlite(ASYNC_DATABASE_URL) else {},
+    **_engine_options(ASYNC_DATABASE_URL),
+)
+# Objects stay readable after commit so responses can be built without a refresh round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if _is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+if _is_sqlite(ASYNC_DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 Base = declarative_base()
 
+def dialect_insert(bind):
+    """INSERT construct with ON CONFLICT support for the bound dialect."""
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise ValueError(f"Upserts are not supported on {dialect}")
+    return insert
+
+# Only opening and closing the session are timed; the request runs in between
 def get_db():
-    db = SessionLocal()
+    with stage("db.session.open"):
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        with stage("db.session.close"):
+            db.close()
+
+async def get_async_db():
+    with stage("db.async_session.open"):
+        db = AsyncSessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        with stage("db.async_session.close"):
+            await db.close()
@@ -0,0 +1,270 @@
+"""Feature drift: scored features are binned against the training reference and compared by PSI and KS."""
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import func, select
+import database, model_registry, models
+
+REFERENCE_FILE = model_registry.DRIFT_REFERENCE_FILE
+MAX_BINS = 10
+FLUSH_INTERVAL = float(os.getenv("EARLYWARN_DRIFT_FLUSH_INTERVAL", "10"))
+PSI_WARN = float(os.getenv("EARLYWARN_DRIFT_PSI_WARN", "0.1"))
+PSI_ALERT = float(os.getenv("EARLYWARN_DRIFT_PSI_ALERT", "0.25"))
+KS_ALERT = float(os.getenv("EARLYWARN_DRIFT_KS_ALERT", "0.2"))
+MIN_SAMPLES = int(os.getenv("EARLYWARN_DRIFT_MIN_SAMPLES", "200"))
+# Empty bins would make PSI infinite
+MIN_PROPORTION = 1e-4
+
+def _edges(values):
+    unique = np.unique(values)
+    if len(unique) <= MAX_BINS:
+        # One bin per observed value, split halfway between neighbours
+        return ((unique[:-1] + unique[1:]) / 2).tolist()
+    quantiles = np.quantile(values, np.linspace(0, 1, MAX_BINS + 1)[1:-1])
+    return np.unique(quantiles).tolist()
+
+def build_reference(X, feature_names):
+    """Reference histograms of the (n, F) training matrix, JSON-serializable."""
+    X = np.asarray(X, dtype=np.float64)
+    features = {}
+    for i, name in enumerate(feature_names):
+        edges = _edges(X[:, i])
+        bins = np.searchsorted(edges, X[:, i], side="right")
+        features[name] = {"edges": edges, "counts": np.bincount(bins, minlength=len(edges) + 1).tolist()}
+    return {"n": int(len(X)), "features": features}
+
+def save_reference(reference, directory):
+    with open(os.path.join(directory, REFERENCE_FILE), "w") as f:
+        json.dump(reference, f)
+
+class Reference:
+    """A saved reference, with edges prepared for both per-row and batch binning."""
+
+    def __init__(self, data):
+        self.n = data["n"]
+        self.names = list(data["features"])
+        self.edges = [data["features"][name]["edges"] for name in self.names]
+        self.edge_arrays = [np.asarray(edges) for edges in self.edges]
+        self.counts = [data["features"][name]["counts"] for name in self.names]
+
+def load_reference(directory):
+    """The reference saved beside a model, or None for models trained without one."""
+    path = os.path.join(directory, REFERENCE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return Reference(json.load(f))
+
+def bin_batch(reference, matrix, counts=None):
+    """Add an (n, F) array of features into per-feature bin counts (new ones if `counts` is None)."""
+    if counts is None:
+        counts = [[0] * (len(edges) + 1) for edges in reference.edges]
+    for feature_counts, edges, column in zip(counts, reference.edge_arrays, np.asarray(matrix).T):
+        binned = np.bincount(np.searchsorted(edges, column, side="right"), minlength=len(edges) + 1)
+        for b, n in enumerate(binned.tolist()):
+            feature_counts[b] += n
+    return counts
+
+def today():
+    """Counts are bucketed by UTC day, whatever the server's timezone."""
+    return datetime.now(timezone.utc).date()
+
+class DriftMonitor:
+    """Per-process bin counts awaiting a flush, keyed by model version.
+
+    Only counts for committed predictions belong here: callers bin locally and
+    `add` (or `observe`) once their transaction has committed.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}  # version -> (feature names, per-feature count lists)
+        self._flusher = None
+        # A forked child must not flush the counts its parent will flush too
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher = None
+
+    def _merge(self, version, names, counts):
+        with self._lock:
+            entry = self._pending.get(version)
+            if entry is None:
+                self._pending[version] = (names, [list(feature_counts) for feature_counts in counts])
+                return
+            for pending_counts, new in zip(entry[1], counts):
+                for b, n in enumerate(new):
+                    pending_counts[b] += n
+
+    def add(self, version, names, counts):
+        """Merge per-feature bin counts from `bin_batch` for committed predictions."""
+        self._merge(version, names, counts)
+        self._ensure_flusher()
+
+    def observe(self, bundle, row):
+        """Count one scored feature row (ordered as the reference's features)."""
+        reference = bundle.drift_reference
+        if reference is None:
+            return
+        counts = [[0] * (len(edges) + 1) for edges in reference.edges]
+        for feature_counts, edges, value in zip(counts, reference.edges, row):
+            feature_counts[bisect.bisect_right(edges, value)] += 1
+        self.add(bundle.version, reference.names, counts)
+
+    def observe_batch(self, bundle, matrix):
+        """Count an (n, F) array of scored features."""
+        reference = bundle.drift_reference
+        if reference is None or not len(matrix):
+            return
+        self.add(bundle.version, reference.names, bin_batch(reference, matrix))
+
+    def take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def flush(self, db, day=None):
+        """Add pending counts into `feature_drift_counts` and commit.
+
+        If the write fails the counts are kept for the next flush.
+        """
+        pending = self.take()
+        day = day or today()
+        rows = [
+            {"model_version": version, "day": day, "feature": name, "bin": b, "count": n}
+            for version, (names, counts) in pending.items()
+            for name, feature_counts in zip(names, counts)
+            for b, n in enumerate(feature_counts)
+            if n
+        ]
+        if not rows:
+            return 0
+        try:
+            table = models.FeatureDriftCount
+            stmt = database.dialect_insert(db.get_bind())(table)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[table.model_version, table.day, table.feature, table.bin],
+                set_={"count": table.count + stmt.excluded.count},
+            ), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for version, (names, counts) in pending.items():
+                self._merge(version, names, counts)
+            raise
+        return len(rows)
+
+    def flush_pending(self):
+        """Flush on a session of its own, logging rather than raising on failure."""
+        db = database.SessionLocal()
+        try:
+            return self.flush(db)
+        except Exception as e:
+            print(f"Drift counts not flushed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _ensure_flusher(self):
+        # Started lazily, so each (possibly forked) process that observes runs its own
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever, name="drift-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush_pending()
+
+monitor = DriftMonitor()
+
+def _proportions(counts):
+    counts = np.asarray(counts, dtype=np.float64)
+    return np.clip(counts / max(counts.sum(), 1.0), MIN_PROPORTION, None)
+
+def psi(expected_counts, actual_counts):
+    expected, actual = _proportions(expected_counts), _proportions(actual_counts)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+def ks_distance(expected_counts, actual_counts):
+    """Largest gap between the two CDFs, evaluated at the bin edges."""
+    expected = np.cumsum(expected_counts) / max(np.sum(expected_counts), 1)
+    actual = np.cumsum(actual_counts) / max(np.sum(actual_counts), 1)
+    return float(np.abs(expected - actual).max())
+
+def _status(psi_value, ks_value, n):
+    if n < MIN_SAMPLES:
+        return "insufficient_data"
+    if psi_value >= PSI_ALERT or ks_value >= KS_ALERT:
+        return "alert"
+    if psi_value >= PSI_WARN:
+        return "warn"
+    return "ok"
+
+STATUS_ORDER = ("ok", "insufficient_data", "warn", "alert")
+
+def report(db, bundle, days=7):
+    """Drift of the last `days` days of scored features against the training reference."""
+    result = {
+        "model_version": bundle.version,
+        "window_days": days,
+        "thresholds": {"psi_warn": PSI_WARN, "psi_alert": PSI_ALERT, "ks_alert": KS_ALERT, "min_samples": MIN_SAMPLES},
+        "features": {},
+    }
+    reference = bundle.drift_reference
+    if reference is None:
+        return {**result, "status": "no_reference", "n": 0}
+
+    table = models.FeatureDriftCount
+    totals = {}
+    for feature, b, n in db.execute(
+        select(table.feature, table.bin, func.sum(table.count))
+        .where(table.model_version == bundle.version, table.day > today() - timedelta(days=days))
+        .group_by(table.feature, table.bin)
+    ):
+        totals[(feature, b)] = int(n)
+
+    statuses = []
+    observed = 0
+    for name, edges, expected in zip(reference.names, reference.edges, reference.counts):
+        actual = [totals.get((name, b), 0) for b in range(len(expected))]
+        n = sum(actual)
+        observed = max(observed, n)
+        psi_value, ks_value = psi(expected, actual), ks_distance(expected, actual)
+        status = _status(psi_value, ks_value, n)
+        statuses.append(status)
+        result["features"][name] = {
+            "n": n,
+            "psi": psi_value,
+            "ks": ks_value,
+            "status": status,
+            "edges": edges,
+            "reference": (np.asarray(expected) / max(sum(expected), 1)).tolist(),
+            "current": (np.asarray(actual) / max(n, 1)).tolist(),
+        }
+    return {**result, "status": max(statuses, key=STATUS_ORDER.index), "n": observed}
+
+if __name__ == "__main__":
+    import training
+
+    parser = argparse.ArgumentParser(description="Write a drift reference for an existing model directory.")
+    parser.add_argument("directory", help="Directory holding model.pkl")
+    parser.add_argument("--source", choices=["db", "csv", "parquet", "synthetic"], default="db")
+    parser.add_argument("--path", help="Input file for csv/parquet sources")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows for the synthetic source")
+    args = parser.parse_args()
+    X, _ = training.load(training.source_chunks(args.source, args.path, args.rows))
+    save_reference(build_reference(X, training.FEATURES), args.directory)
+    print(f"Wrote {os.path.join(args.directory, REFERENCE_FILE)} from {len(X):,} rows")
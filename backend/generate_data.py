@@ -1,34 +1,51 @@
+"""Synthetic Nigerian student cohorts, streamed in seeded chunks to CSV, Parquet or the database.
+
+The output depends only on the seed and chunk size, not on the worker count.
+"""
+import argparse
 import csv
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import numpy as np
+import pandas as pd
 
-def generate_nigerian_student_data(num_students=500):
-    first_names = [
-        "Chinedu", "Adebayo", "Ngozi", "Emeka", "Fatima", "Yusuf", "Chioma", "Kelechi",
-        "Tunde", "Zainab", "Olumide", "Ify", "Musa", "Ada", "Funke", "Chika", "Bisi",
-        "Sola", "Ibrahim", "Amina", "Uche", "Nneka", "Segun", "Folake", "Kemi", "Bola",
-        "Dapo", "Tari", "Efe", "Ogechi", "Amara", "Obinna", "Jide", "Simi", "Femi"
-    ]
-    last_names = [
-        "Okeke", "Adeyemi", "Okonkwo", "Bello", "Abubakar", "Eze", "Okafor", "Williams",
-        "Johnson", "Mensah", "Sowore", "Balogun", "Ojo", "Aliyu", "Mustapha", "Nwachukwu",
-        "Umar", "Hassan", "Garba", "Danjuma", "Lawal", "Ayinla", "Akinwumi", "Ogundipe",
-        "Nwosu", "Oni", "Adeleke", "Bankole", "Fashola", "Tinubu", "Sanusi", "Dangote"
-    ]
+FIRST_NAMES = [
+    "Chinedu", "Adebayo", "Ngozi", "Emeka", "Fatima", "Yusuf", "Chioma", "Kelechi",
+    "Tunde", "Zainab", "Olumide", "Ify", "Musa", "Ada", "Funke", "Chika", "Bisi",
+    "Sola", "Ibrahim", "Amina", "Uche", "Nneka", "Segun", "Folake", "Kemi", "Bola",
+    "Dapo", "Tari", "Efe", "Ogechi", "Amara", "Obinna", "Jide", "Simi", "Femi"
+]
+LAST_NAMES = [
+    "Okeke", "Adeyemi", "Okonkwo", "Bello", "Abubakar", "Eze", "Okafor", "Williams",
+    "Johnson", "Mensah", "Sowore", "Balogun", "Ojo", "Aliyu", "Mustapha", "Nwachukwu",
+    "Umar", "Hassan", "Garba", "Danjuma", "Lawal", "Ayinla", "Akinwumi", "Ogundipe",
+    "Nwosu", "Oni", "Adeleke", "Bankole", "Fashola", "Tinubu", "Sanusi", "Dangote"
+]
+HEADERS = [
+    "student_id", "name", "gpa", "attendance_rate",
+    "assignments_completed", "household_income_bracket",
+    "parent_education_level", "risk_level"
+]
+DEFAULT_CHUNK_SIZE = 100_000
+# Ignored by git; the dataset shipped in frontend/public is only replaced with an explicit --out
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../ml/data/training_dataset.csv")
+
+# Every "first last" pair; picking one uniformly is picking both names independently
+_FULL_NAMES = np.array([f"{first} {last}" for first, last in product(FIRST_NAMES, LAST_NAMES)], dtype=object)
 
+def generate_nigerian_student_data(num_students=500):
     data = []
-    headers = [
-        "student_id", "name", "gpa", "attendance_rate", 
-        "assignments_completed", "household_income_bracket", 
-        "parent_education_level", "risk_level"
-    ]
-    data.append(headers)
+    data.append(HEADERS)
 
     for i in range(1, num_students + 1):
         # Generate Student ID
         student_id = f"S{str(i).zfill(3)}"
 
         # Generate Name
-        name = f"{random.choice(first_names)} {random.choice(last_names)}"
+        name = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
 
         # Generate Features with some correlation
         # Higher attendance/assignments usually correlate with higher GPA
@@ -67,6 +84,126 @@ def generate_nigerian_student_data(num_students=500):
 
     return data
 
+def generate_chunk(start, n, seed=0):
+    """Students `start`..`start + n - 1` (1-based) as a DataFrame with HEADERS columns."""
+    rng = np.random.default_rng([seed, start])
+    ids = np.arange(start, start + n)
+
+    # Same correlation logic as generate_nigerian_student_data
+    attendance_rate = rng.uniform(0.5, 1.0, n).round(2)
+    # GPA bonus band by attendance: > 0.9 -> U(1.0, 2.0), > 0.7 -> U(0.5, 1.5), else U(0.0, 1.0)
+    low = np.select([attendance_rate > 0.9, attendance_rate > 0.7], [1.0, 0.5], 0.0)
+    gpa = np.minimum(2.0 + rng.uniform(low, low + 1.0), 4.0).round(2)
+
+    assignments_completed = (attendance_rate * 20).astype(np.int64) + rng.integers(-2, 3, n)
+    assignments_completed = assignments_completed.clip(0, 20)
+
+    risk_score = 0.4 * (gpa < 2.0) + 0.3 * (attendance_rate < 0.75) + 0.2 * (assignments_completed < 8)
+    prob = np.minimum(risk_score, 1.0)
+    risk_level = np.select([prob > 0.6, prob > 0.3], ["High", "Medium"], "Low")
+
+    return pd.DataFrame({
+        "student_id": pd.Series(ids).astype(str).str.zfill(3).radd("S"),
+        "name": _FULL_NAMES[rng.integers(0, len(_FULL_NAMES), n)],
+        "gpa": gpa,
+        "attendance_rate": attendance_rate,
+        "assignments_completed": assignments_completed,
+        "household_income_bracket": rng.integers(1, 5, n), # 1: Low, 4: High
+        "parent_education_level": rng.integers(1, 5, n),   # 1: High School, 4: PhD
+        "risk_level": risk_level,
+    })
+
+def csv_text(frame):
+    """A chunk as CSV text without the header row (formatting is the slow part of CSV output)."""
+    return frame.to_csv(header=False, index=False)
+
+def _generate_chunk(task):
+    start, n, seed, render = task
+    frame = generate_chunk(start, n, seed)
+    return frame if render is None else render(frame)
+
+def iter_chunks(num_students, chunk_size=DEFAULT_CHUNK_SIZE, seed=0, workers=1, render=None):
+    """Yield DataFrames of up to `chunk_size` students, in order.
+
+    `render`, a module-level function of the DataFrame, is applied in the
+    worker and its result yielded instead. With `workers > 1` chunks are
+    generated on a process pool, at most two per worker ahead of the consumer
+    so memory stays bounded.
+    """
+    tasks = [
+        (start, min(chunk_size, num_students - start + 1), seed, render)
+        for start in range(1, num_students + 1, chunk_size)
+    ]
+    if workers <= 1:
+        for task in tasks:
+            yield _generate_chunk(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for task in tasks:
+            pending.append(executor.submit(_generate_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+def write_csv(chunks, path):
+    """Write DataFrame chunks, or `csv_text` chunks, to one CSV file; returns the row count."""
+    rows = 0
+    with open(path, "w", newline="") as f:
+        f.write(",".join(HEADERS) + "\n")
+        for chunk in chunks:
+            text = chunk if isinstance(chunk, str) else csv_text(chunk)
+            f.write(text)
+            rows += text.count("\n")
+    return rows
+
+def write_parquet(chunks, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet output requires pyarrow (pip install pyarrow)")
+    rows = 0
+    writer = None
+    try:
+        for frame in chunks:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def write_db(chunks, db=None):
+    """Upsert the students (with their at-risk label) into the database; commits per chunk."""
+    import database, ingest, migrations, models
+
+    if db is None:
+        migrations.run(database.engine)
+    session = db or database.SessionLocal()
+    rows = 0
+    try:
+        for frame in chunks:
+            frame = frame.assign(**{
+                ingest.LABEL_FIELD: frame["risk_level"].isin(ingest.AT_RISK_LEVELS).astype(int),
+                "feature_fingerprint": [
+                    models.feature_fingerprint(*values)
+                    for values in zip(*(frame[field].tolist() for field in models.FEATURE_FIELDS))
+                ],
+            }).drop(columns="risk_level")
+            # Generated rows are valid by construction, so validate_chunk is skipped
+            rows += ingest.upsert_students(session, frame.to_dict("records"))
+            session.commit()
+    finally:
+        if db is None:
+            session.close()
+    return rows
+
 def save_to_csv(data, filename="training_dataset.csv"):
     with open(filename, mode='w', newline='') as file:
         writer = csv.writer(file)
@@ -74,5 +211,27 @@ def save_to_csv(data, filename="training_dataset.csv"):
     print(f"Successfully generated {len(data)-1} records to {filename}")
 
 if __name__ == "__main__":
-    dataset = generate_nigerian_student_data(500)
-    save_to_csv(dataset, "/Users/evidence/Projects/EarlyWarn-AI/frontend/public/training_dataset.csv") 
+    parser = argparse.ArgumentParser(description="Generate a synthetic student cohort.")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes")
+    parser.add_argument("--format", choices=["csv", "parquet", "db"], help="Defaults to the --out extension")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Output file for csv/parquet")
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.out.endswith((".parquet", ".pq")) else "csv")
+    started = time.perf_counter()
+    chunks = iter_chunks(args.rows, args.chunk_size, args.seed, args.workers, render=csv_text if fmt == "csv" else None)
+    try:
+        if fmt == "db":
+            rows = write_db(chunks)
+            target = "the database"
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+            rows = (write_parquet if fmt == "parquet" else write_csv)(chunks, args.out)
+            target = args.out
+    except ValueError as e:
+        parser.error(str(e))
+    seconds = time.perf_counter() - started
+    print(f"Successfully generated {rows} records to {target} in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)")
@@ -0,0 +1,100 @@
+"""Password hashing on a dedicated, bounded thread pool.
+
+bcrypt is deliberately slow (tens to hundreds of milliseconds per call). Run on
+the event loop it stalls every request on the worker; run on the shared
+threadpool a login burst starves the sync routes. Here at most HASH_WORKERS
+hashes run at once and at most HASH_MAX_PENDING may be waiting or running;
+beyond that callers get `HashingOverloaded` and should answer 503 so clients
+back off instead of queueing unboundedly.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_WORKERS = int(os.getenv("EARLYWARN_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("EARLYWARN_HASH_MAX_PENDING", "64"))
+RETRY_AFTER_SECONDS = int(os.getenv("EARLYWARN_HASH_RETRY_AFTER", "1"))
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is at its ceiling."""
+
+class HashingPool:
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self._lock = threading.Lock()
+        self.pending = 0        # queued + running
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _call(self, enqueued_at, fn, args):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            wait = started - enqueued_at
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_seconds_total += time.perf_counter() - started
+
+    def submit(self, fn, *args):
+        """Queue `fn(*args)`; raises HashingOverloaded at the pending ceiling."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloaded(f"{self.pending} password hashes already pending")
+            self.pending += 1
+            self.submitted += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            future = self._executor.submit(self._call, time.perf_counter(), fn, args)
+        except Exception:
+            self._release(None)
+            raise
+        # Also fires when a queued call is cancelled and `_call` never runs
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "queued": self.pending - self.running,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": completed,
+                "rejected": self.rejected,
+                "max_pending_seen": self.max_pending_seen,
+                "avg_wait_ms": self.wait_seconds_total / completed * 1000 if completed else 0.0,
+                "max_wait_ms": self.wait_seconds_max * 1000,
+                "avg_run_ms": self.run_seconds_total / completed * 1000 if completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+pool = HashingPool()
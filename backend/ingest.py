@@ -0,0 +1,163 @@
+"""Bulk student import from CSV or Parquet.
+
+Files are streamed in chunks, validated against `schemas.StudentCreate` and
+upserted on `student_id` with one executemany per chunk, so memory stays bounded
+by the chunk size regardless of file size.
+
+Usage:
+    python ingest.py students.csv [--chunk-size 5000]
+"""
+import argparse
+import json
+import os
+import time
+import pandas as pd
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import database, migrations, models, schemas
+
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_REJECTS = 1000
+
+STUDENT_FIELDS = [
+    "student_id", "name", "gpa", "attendance_rate", "assignments_completed",
+    "household_income_bracket", "parent_education_level",
+]
+# Optional training label: an `at_risk` 0/1 column, or a `risk_level` column
+# where these levels count as at risk
+LABEL_FIELD = "at_risk"
+AT_RISK_LEVELS = ("High", "Medium")
+RISK_LEVELS = ("Low", "Medium", "High")
+
+def detect_format(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    return "csv"
+
+def iter_record_chunks(fileobj, fmt="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of raw row dicts from a CSV or Parquet file object."""
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet import requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(fileobj).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+    elif fmt == "csv":
+        # Read everything as text and let the schema do the type coercion so
+        # that bad cells become per-row rejects instead of a failed chunk.
+        reader = pd.read_csv(fileobj, chunksize=chunk_size, dtype=str, keep_default_na=False)
+        for chunk in reader:
+            yield chunk.to_dict("records")
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def parse_label(record):
+    """0/1 label from an `at_risk` or `risk_level` value, None when absent."""
+    value = record.get(LABEL_FIELD)
+    if value is not None and str(value).strip() != "":
+        value = str(value).strip().lower()
+        if value in ("1", "1.0", "true", "yes"):
+            return 1
+        if value in ("0", "0.0", "false", "no"):
+            return 0
+        raise ValueError(f"at_risk must be 0 or 1, got {record.get(LABEL_FIELD)!r}")
+    level = record.get("risk_level")
+    if level is None or str(level).strip() == "":
+        return None
+    level = str(level).strip().capitalize()
+    if level not in RISK_LEVELS:
+        raise ValueError(f"risk_level must be one of {', '.join(RISK_LEVELS)}, got {record.get('risk_level')!r}")
+    return int(level in AT_RISK_LEVELS)
+
+def validate_chunk(records, first_row):
+    """Split raw records into valid column dicts and rejects.
+
+    `first_row` is the 1-based data row number of `records[0]`, used for reporting.
+    """
+    valid, rejects = [], []
+    for offset, record in enumerate(records):
+        try:
+            student = schemas.StudentCreate(**record)
+            label = parse_label(record)
+        except ValidationError as e:
+            rejects.append({
+                "row": first_row + offset,
+                "student_id": str(record.get("student_id", "")) or None,
+                "errors": [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()],
+            })
+            continue
+        except ValueError as e:
+            rejects.append({
+                "row": first_row + offset,
+                "student_id": str(record.get("student_id", "")) or None,
+                "errors": [str(e)],
+            })
+            continue
+        row = {field: getattr(student, field) for field in STUDENT_FIELDS}
+        row[LABEL_FIELD] = label
+        row["feature_fingerprint"] = models.feature_fingerprint(*(row[field] for field in models.FEATURE_FIELDS))
+        valid.append(row)
+    return valid, rejects
+
+def _insert_statement(db: Session):
+    stmt = database.dialect_insert(db.get_bind())(models.Student)
+    set_ = {field: stmt.excluded[field] for field in STUDENT_FIELDS + ["feature_fingerprint"] if field != "student_id"}
+    # Files without labels keep the outcome already on record
+    set_[LABEL_FIELD] = func.coalesce(stmt.excluded[LABEL_FIELD], models.Student.at_risk)
+    return stmt.on_conflict_do_update(index_elements=[models.Student.student_id], set_=set_)
+
+def upsert_students(db: Session, rows):
+    """Insert or update students by student_id with a single executemany."""
+    if not rows:
+        return 0
+    # A statement may not touch the same row twice; the last occurrence wins
+    deduped = list({row["student_id"]: row for row in rows}.values())
+    db.execute(_insert_statement(db), deduped)
+    return len(deduped)
+
+def import_students(db: Session, fileobj, fmt="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a file into the students table; commits once per chunk."""
+    started = time.perf_counter()
+    received = upserted = rejected = 0
+    rejects = []
+
+    for records in iter_record_chunks(fileobj, fmt, chunk_size):
+        valid, chunk_rejects = validate_chunk(records, first_row=received + 1)
+        received += len(records)
+        rejected += len(chunk_rejects)
+        rejects.extend(chunk_rejects[:MAX_REPORTED_REJECTS - len(rejects)])
+
+        upserted += upsert_students(db, valid)
+        db.commit()
+
+    seconds = time.perf_counter() - started
+    return {
+        "received": received,
+        "upserted": upserted,
+        "rejected": rejected,
+        "rejects": rejects,
+        "seconds": seconds,
+        "rows_per_second": received / seconds if seconds > 0 else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import students from CSV or Parquet.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    migrations.run(database.engine)
+    db = database.SessionLocal()
+    try:
+        with open(args.path, "rb") as f:
+            summary = import_students(db, f, args.format or detect_format(args.path), args.chunk_size)
+    finally:
+        db.close()
+
+    print(json.dumps({k: v for k, v in summary.items() if k != "rejects"}, indent=2))
+    for reject in summary["rejects"][:20]:
+        print(f"Rejected row {reject['row']}: {'; '.join(reject['errors'])}")
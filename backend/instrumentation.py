@@ -0,0 +1,223 @@
+"""Always-on stage timers and an on-demand sampling profiler.
+
+`stage("name")` times a block into a latency histogram; `RuntimeMetricsMiddleware`
+times every request by route. Both are rendered in the Prometheus text format by
+`render_prometheus()` (served at /metrics/runtime).
+
+The profiler is off unless EARLYWARN_PROFILER=1 and EARLYWARN_PROFILE_SECRET
+are set; a request whose `X-Profile` header carries that secret is profiled by
+sampling every thread's stack while it runs. The response carries `X-Profile-Id`;
+the dump, in collapsed-stack format (one `frame;frame;frame count` line per
+stack, ready for flamegraph.pl or speedscope), is fetched from
+/admin/profiles/{id}.
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from cache import LRUCache
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILER_ENABLED = os.getenv("EARLYWARN_PROFILER", "0") == "1"
+# Profiling slows the request and the dump exposes code paths, so callers must know this
+PROFILE_SECRET = os.getenv("EARLYWARN_PROFILE_SECRET", "")
+PROFILE_INTERVAL = float(os.getenv("EARLYWARN_PROFILE_INTERVAL", "0.001"))
+PROFILE_MAX_SECONDS = float(os.getenv("EARLYWARN_PROFILE_MAX_SECONDS", "30"))
+
+class Histogram:
+    """Cumulative-bucket latency histogram, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+stage_seconds = Histogram(
+    "earlywarn_stage_seconds", "Time spent in instrumented hot-path stages.", ("stage",)
+)
+request_seconds = Histogram(
+    "earlywarn_request_seconds", "End-to-end request latency by route.", ("method", "route", "status")
+)
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block into earlywarn_stage_seconds{stage=name}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe((name,), time.perf_counter() - started)
+
+def render_prometheus():
+    return "\n".join(stage_seconds.render() + request_seconds.render() + _profiler_lines()) + "\n"
+
+_profiles = LRUCache(maxsize=int(os.getenv("EARLYWARN_PROFILE_KEEP", "32")))
+_profile_lock = threading.Lock()  # one profile at a time keeps the overhead bounded
+_profiles_taken = 0
+_profiles_skipped = 0
+
+class SamplingProfiler:
+    """Samples all thread stacks on a background thread until stopped."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names.setdefault(thread.ident, thread.name)
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def start_profile():
+    """Start profiling if no other profile is running; returns (id, profiler) or None."""
+    global _profiles_skipped
+    if not PROFILER_ENABLED:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        _profiles_skipped += 1
+        return None
+    return uuid.uuid4().hex, SamplingProfiler().start()
+
+def profile_requested(header_value):
+    """Whether an `X-Profile` header value carries the profiling secret."""
+    if not (PROFILER_ENABLED and PROFILE_SECRET) or header_value is None:
+        return False
+    return hmac.compare_digest(header_value, PROFILE_SECRET.encode())
+
+def finish_profile(profile_id, profiler, label):
+    global _profiles_taken
+    try:
+        profiler.stop()
+        header = f"# {label} samples={profiler.samples} interval={profiler.interval}s\n"
+        _profiles.set(profile_id, header + profiler.collapsed())
+        _profiles_taken += 1
+    finally:
+        _profile_lock.release()
+
+def get_profile(profile_id):
+    return _profiles.get(profile_id)
+
+def _profiler_lines():
+    return [
+        "# HELP earlywarn_profiles_total On-demand profiles taken or skipped because one was running.",
+        "# TYPE earlywarn_profiles_total counter",
+        f'earlywarn_profiles_total{{result="taken"}} {_profiles_taken}',
+        f'earlywarn_profiles_total{{result="skipped"}} {_profiles_skipped}',
+    ]
+
+class RuntimeMetricsMiddleware:
+    """ASGI middleware: per-route request timing and secret-gated profiling."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = None
+        requested = next((value for name, value in scope.get("headers", []) if name == b"x-profile"), None)
+        if profile_requested(requested):
+            profile = start_profile()
+        status = 500
+
+        def finish():
+            nonlocal profile
+            if profile is not None:
+                finish_profile(profile[0], profile[1], f"{scope['method']} {scope['path']}")
+                profile = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile[0].encode())]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Store the dump before the client sees the end of the response
+                finish()
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            request_seconds.observe((scope["method"], path, str(status)), time.perf_counter() - started)
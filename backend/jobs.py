@@ -0,0 +1,197 @@
+"""Background cohort scoring on a local process pool.
+
+A job is split into shards of consecutive existing `Student.id`s. Each shard is
+scored in a worker process with `scoring.score_students` and reports its own
+progress to the `scoring_jobs` / `scoring_job_shards` tables, so the API process
+only enqueues work and reads progress back. A job is owned by the process whose
+pool runs it; jobs left unfinished by a process that exited are failed at startup.
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+import database, drift, ml_service, models, scoring
+
+# Leaves half the cores to the API workers serving requests on the same host
+JOB_WORKERS = int(os.getenv("EARLYWARN_JOB_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused here
+    database.engine.dispose(close=False)
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, initializer=_init_worker)
+        return _executor
+
+def shutdown_executor(wait=False):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=not wait)
+            _executor = None
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _owner_alive(owner):
+    if owner is None:
+        return False  # Created before jobs recorded their owner
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True  # Can't tell from here; its own host recovers it
+    if not pid.isdigit() or int(pid) == os.getpid():
+        # Recovery runs before this process creates jobs, so its pid on a job is a reused one
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def shard_ranges(db: Session, shard_size):
+    """(first id, last id) of each run of `shard_size` existing students, walked by keyset.
+
+    Gaps in the id sequence don't produce empty or undersized shards.
+    """
+    after = 0
+    while True:
+        query = select(models.Student.id).where(models.Student.id > after).order_by(models.Student.id)
+        start = db.scalar(query.limit(1))
+        if start is None:
+            return
+        end = db.scalar(query.offset(shard_size - 1).limit(1))
+        if end is None:
+            end = db.scalar(select(func.max(models.Student.id)))
+        yield start, end
+        after = end
+
+def create_job(db: Session, shard_size=scoring.DEFAULT_CHUNK_SIZE, chunk_size=scoring.DEFAULT_CHUNK_SIZE, force=False):
+    """Persist a job covering every student and submit its shards to the pool."""
+    total = db.scalar(select(func.count(models.Student.id)))
+
+    job = models.ScoringJob(shard_size=shard_size, total_students=total or 0, owner=_owner())
+    db.add(job)
+    db.flush()
+
+    for start, end in shard_ranges(db, shard_size):
+        db.add(models.ScoringJobShard(job_id=job.id, start_id=start, end_id=end))
+    db.flush()
+    job.shard_count = len(job.shards)
+    if job.shard_count == 0:
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+
+    executor = get_executor()
+    for i, shard in enumerate(job.shards):
+        try:
+            executor.submit(run_shard, job.id, shard.id, chunk_size, force)
+        except Exception:
+            # A broken or shut down pool never runs them; fail the rest now
+            # and let the next job start a fresh pool
+            error = traceback.format_exc(limit=5)
+            shutdown_executor()
+            for unsubmitted in job.shards[i:]:
+                unsubmitted.status = "failed"
+                unsubmitted.error = error
+                _finish_shard(db, job.id, unsubmitted, scored=0, skipped=0, failed=True, started=time.perf_counter())
+            db.refresh(job)
+            break
+    return job
+
+def run_shard(job_id, shard_id, chunk_size=scoring.DEFAULT_CHUNK_SIZE, force=False):
+    """Worker entry point: score one id range and record the outcome."""
+    db = database.SessionLocal()
+    started = time.perf_counter()
+    try:
+        shard = db.query(models.ScoringJobShard).filter(models.ScoringJobShard.id == shard_id).first()
+        if shard is None:
+            print(f"Scoring job {job_id} has no shard {shard_id}; skipping it")
+            return
+        shard.status = "running"
+        db.query(models.ScoringJob).filter(
+            models.ScoringJob.id == job_id, models.ScoringJob.status == "queued"
+        ).update({"status": "running", "started_at": datetime.utcnow()})
+        db.commit()
+
+        try:
+            ml_service.ensure_current()
+            # score_students commits the shard's predictions in one transaction
+            summary = scoring.score_students(
+                db, chunk_size=chunk_size, min_id=shard.start_id, max_id=shard.end_id, force=force
+            )
+        except Exception:
+            db.rollback()
+            shard.status = "failed"
+            shard.error = traceback.format_exc(limit=5)
+            _finish_shard(db, job_id, shard, scored=0, skipped=0, failed=True, started=started)
+            return
+
+        # Pool workers may be shut down before their flusher runs again
+        drift.monitor.flush_pending()
+        shard.status = "completed"
+        shard.high_risk = summary["risk_counts"]["High"]
+        shard.medium_risk = summary["risk_counts"]["Medium"]
+        shard.low_risk = summary["risk_counts"]["Low"]
+        _finish_shard(db, job_id, shard, scored=summary["scored"], skipped=summary["skipped"], failed=False, started=started)
+    finally:
+        db.close()
+
+def _finish_shard(db: Session, job_id, shard, scored, skipped, failed, started):
+    shard.scored = scored
+    shard.skipped = skipped
+    shard.duration_ms = (time.perf_counter() - started) * 1000
+    # Counter updates are done in SQL so concurrent workers don't overwrite each other
+    db.query(models.ScoringJob).filter(models.ScoringJob.id == job_id).update({
+        "scored": models.ScoringJob.scored + scored,
+        "skipped": func.coalesce(models.ScoringJob.skipped, 0) + skipped,
+        "completed_shards": models.ScoringJob.completed_shards + 1,
+        "failed_shards": models.ScoringJob.failed_shards + (1 if failed else 0),
+    })
+    # Whichever worker finishes the last shard closes the job
+    db.query(models.ScoringJob).filter(
+        models.ScoringJob.id == job_id,
+        models.ScoringJob.completed_shards >= models.ScoringJob.shard_count,
+        models.ScoringJob.finished_at.is_(None),
+    ).update({
+        "status": case((models.ScoringJob.failed_shards > 0, "failed"), else_="completed"),
+        "finished_at": datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+
+def recover_stale_jobs(db: Session):
+    """Fail the unfinished shards of jobs whose owning process is gone; returns the job ids.
+
+    The pool dies with its process, so nothing would ever finish them.
+    """
+    stale = [
+        job for job in db.query(models.ScoringJob).filter(models.ScoringJob.status.in_(("queued", "running")))
+        if not _owner_alive(job.owner)
+    ]
+    for job in stale:
+        for shard in job.shards:
+            if shard.status in ("queued", "running"):
+                shard.status = "failed"
+                shard.error = f"Owner {job.owner} exited before the shard finished"
+        job.completed_shards = len(job.shards)
+        job.failed_shards = sum(1 for shard in job.shards if shard.status == "failed")
+        job.status = "failed"
+        job.finished_at = datetime.utcnow()
+    db.commit()
+    if stale:
+        print(f"Failed {len(stale)} scoring jobs left unfinished by exited processes")
+    return [job.id for job in stale]
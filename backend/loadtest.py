@@ -0,0 +1,215 @@
+"""In-process load test for the API.
+
+Boots the FastAPI app against a SQLite database seeded with
+`generate_data.iter_chunks`, drives concurrent workloads
+through an in-process ASGI client and reports throughput and latency
+percentiles as JSON. Two reports can be compared to catch regressions.
+
+Usage:
+    python loadtest.py run [--workloads simulate,predict,list,login] [--concurrency 16]
+                           [--duration 10] [--students 2000] [--db bench.db] [--out run.json]
+    python loadtest.py compare baseline.json candidate.json [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+WORKLOADS = ["simulate", "predict", "list", "login"]
+BENCH_USER = "loadtest"
+BENCH_PASSWORD = "loadtest-password"
+
+def _prepare_database(db_path, n_students):
+    """Point the app at `db_path` and seed it. Must run before the app is imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    import database, generate_data, ingest, migrations, models
+    from routers import auth
+
+    migrations.run(database.engine)
+    db = database.SessionLocal()
+    try:
+        if db.query(models.Student).count() < n_students:
+            generate_data.write_db(generate_data.iter_chunks(n_students, ingest.DEFAULT_CHUNK_SIZE), db)
+        if db.query(models.User).filter(models.User.username == BENCH_USER).first() is None:
+            db.add(models.User(username=BENCH_USER, hashed_password=auth.get_password_hash(BENCH_PASSWORD)))
+            db.commit()
+        student_ids = [row[0] for row in db.query(models.Student.id).all()]
+    finally:
+        db.close()
+    return student_ids
+
+def _request_factory(workload, student_ids, rng):
+    """Return a coroutine function issuing one request of `workload`."""
+    if workload == "simulate":
+        def make(client, headers):
+            return client.post("/predict/simulate", headers=headers, json={
+                "gpa": round(rng.uniform(0.0, 4.0), 2),
+                "attendance_rate": round(rng.uniform(0.5, 1.0), 2),
+                "assignments_completed": rng.randint(0, 20),
+                "household_income_bracket": rng.randint(1, 4),
+                "parent_education_level": rng.randint(1, 4),
+            })
+    elif workload == "predict":
+        def make(client, headers):
+            return client.post(f"/predict/?student_id={rng.choice(student_ids)}", headers=headers)
+    elif workload == "list":
+        def make(client, headers):
+            return client.get("/students/?limit=100", headers=headers)
+    elif workload == "login":
+        def make(client, headers):
+            return client.post("/auth/token", data={"username": BENCH_USER, "password": BENCH_PASSWORD})
+    else:
+        raise ValueError(f"Unknown workload: {workload}")
+    return make
+
+async def _drive(app, make_request, headers, concurrency, duration, max_requests):
+    import httpx
+
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + duration
+    issued = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+        async def worker():
+            nonlocal issued
+            while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+                issued += 1
+                t0 = time.perf_counter()
+                response = await make_request(client, headers)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if response.status_code >= 400:
+                    errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+def _summarize(latencies, errors, elapsed):
+    data = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_codes": {str(code): count for code, count in sorted(errors.items())},
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": float(data.mean()),
+        "p50_ms": float(np.percentile(data, 50)),
+        "p95_ms": float(np.percentile(data, 95)),
+        "p99_ms": float(np.percentile(data, 99)),
+        "max_ms": float(data.max()),
+    }
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(workloads=WORKLOADS, concurrency=16, duration=10.0, max_requests=None, n_students=2000,
+        db_path=None, warmup=20, seed=0):
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="earlywarn-loadtest-"), "loadtest.db")
+    student_ids = _prepare_database(db_path, n_students)
+
+    import ml_service
+    from main import app
+    from routers import auth
+
+    token = auth.create_access_token({"sub": BENCH_USER})
+    headers = {"Authorization": f"Bearer {token}"}
+    rng = random.Random(seed)
+
+    async def run_all():
+        # One event loop for every workload, so pooled async connections stay valid
+        results = {}
+        for workload in workloads:
+            make_request = _request_factory(workload, student_ids, rng)
+            # Warm caches and lazy imports so they don't land in the measurement
+            await _drive(app, make_request, headers, 1, duration, warmup)
+            latencies, errors, elapsed = await _drive(app, make_request, headers, concurrency, duration, max_requests)
+            results[workload] = _summarize(latencies, errors, elapsed)
+        return results
+
+    results = asyncio.run(run_all())
+
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "model_version": ml_service.get_bundle().version,
+        "database": db_path,
+        "students": len(student_ids),
+        "concurrency": concurrency,
+        "duration_seconds": duration,
+        "results": results,
+    }
+
+def compare(baseline, candidate, threshold=0.1):
+    """Per-workload relative changes; a regression is a throughput drop or a
+    p95/p99 increase larger than `threshold` (a fraction)."""
+    report = {"threshold": threshold, "workloads": {}, "regressions": []}
+    for workload, new in candidate["results"].items():
+        old = baseline["results"].get(workload)
+        if old is None:
+            continue
+        changes = {}
+        for metric, higher_is_worse in (("throughput_rps", False), ("p50_ms", True), ("p95_ms", True), ("p99_ms", True)):
+            delta = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            changes[metric] = {"baseline": old[metric], "candidate": new[metric], "change": delta}
+            worse = delta > threshold if higher_is_worse else delta < -threshold
+            if worse and metric != "p50_ms":
+                report["regressions"].append(f"{workload}.{metric} {delta:+.1%}")
+        if new["errors"] > old["errors"]:
+            report["regressions"].append(f"{workload}.errors {old['errors']} -> {new['errors']}")
+        report["workloads"][workload] = changes
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API in-process.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Seconds per workload")
+    run_parser.add_argument("--requests", type=int, help="Stop a workload after this many requests")
+    run_parser.add_argument("--students", type=int, default=2000)
+    run_parser.add_argument("--db", help="SQLite file to use (default: a fresh temporary file)")
+    run_parser.add_argument("--out", help="Write the report here as well as to stdout")
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+        unknown = set(workloads) - set(WORKLOADS)
+        if unknown:
+            parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+        report = run(workloads, args.concurrency, args.duration, args.requests, args.students, args.db)
+        output = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(output)
+        print(output)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        report = compare(baseline, candidate, args.threshold)
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if report["regressions"] else 0)
@@ -1,10 +1,16 @@
+import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
-from routers import students, predict, auth
+from database import SessionLocal, engine
+from routers import students, predict, auth, admin
+import contributions, hashing, instrumentation, jobs, migrations, ml_service
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Schema setup is a deployment step: `python migrations.py`, or serve.py runs it
+# once before forking workers. Workers started any other way would all race to
+# migrate at startup, so only a single-process dev server should set
+# EARLYWARN_AUTO_MIGRATE=1.
+AUTO_MIGRATE = os.getenv("EARLYWARN_AUTO_MIGRATE", "0") == "1"
 
 app = FastAPI(title="Early-Warn AI API", version="1.0.0")
 
@@ -20,12 +26,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Id", "ETag"],
 )
+# Per-route latency histograms and secret-gated profiling (X-Profile)
+app.add_middleware(instrumentation.RuntimeMetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(students.router)
 app.include_router(predict.router)
+app.include_router(admin.router)
+
+@app.on_event("startup")
+def apply_migrations():
+    if AUTO_MIGRATE:
+        migrations.run(engine)
+
+@app.on_event("startup")
+def recover_scoring_jobs():
+    # Jobs whose worker pool died with an earlier process would stay running forever
+    with SessionLocal() as db:
+        jobs.recover_stale_jobs(db)
+
+@app.on_event("startup")
+def load_feature_schemas():
+    # Decoding contributions then never has to query from the event loop
+    contributions.preload()
+
+@app.on_event("startup")
+def start_model_watcher():
+    # Hot-swap the model whenever the registry's CURRENT pointer changes
+    if os.getenv("EARLYWARN_MODEL_WATCH", "0") == "1":
+        ml_service.start_watcher()
+
+@app.on_event("shutdown")
+def shutdown_job_workers():
+    jobs.shutdown_executor()
+    hashing.pool.shutdown()
+
+@app.get("/metrics/runtime", response_class=PlainTextResponse)
+def read_runtime_metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return instrumentation.render_prometheus()
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,105 @@
+"""Idempotent schema setup for existing databases.
+
+`create_all` only creates missing tables, so indexes and derived tables that were
+added after a database was first created are brought up to date here.
+
+Usage:
+    python migrations.py
+"""
+import json
+from sqlalchemy import inspect, text
+from database import Base, engine
+import models
+
+def _add_missing_columns(conn):
+    # Only nullable columns are added, so existing rows stay valid
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+def _backfill_latest_predictions(conn):
+    has_latest = conn.execute(text("SELECT 1 FROM latest_predictions LIMIT 1")).first()
+    has_predictions = conn.execute(text("SELECT 1 FROM predictions LIMIT 1")).first()
+    if has_latest or not has_predictions:
+        return
+    conn.execute(text("""
+        INSERT INTO latest_predictions (student_id, prediction_id, risk_level, probability, timestamp)
+        SELECT p.student_id, p.id, p.risk_level, p.probability, p.timestamp
+        FROM predictions p
+        WHERE p.student_id IS NOT NULL AND p.id = (
+            SELECT p2.id FROM predictions p2
+            WHERE p2.student_id = p.student_id
+            ORDER BY p2.timestamp DESC, p2.id DESC
+            LIMIT 1
+        )
+    """))
+
+def _backfill_feature_fingerprints(conn, chunk_size=5000):
+    columns = ", ".join(models.FEATURE_FIELDS)
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, {columns} FROM students WHERE feature_fingerprint IS NULL LIMIT {chunk_size}"
+        )).all()
+        if not rows:
+            return
+        conn.execute(
+            text("UPDATE students SET feature_fingerprint = :fingerprint WHERE id = :id"),
+            [{"id": row[0], "fingerprint": models.feature_fingerprint(*row[1:])} for row in rows],
+        )
+
+def _pack_legacy_contributions(conn, chunk_size=5000):
+    import contributions
+
+    last_id = 0
+    # schema_id() doesn't cache ids made on `conn`; there are only a few distinct name lists
+    schema_ids = {}
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, feature_contributions FROM predictions"
+            " WHERE id > :last_id AND contributions_packed IS NULL AND feature_contributions IS NOT NULL"
+            f" ORDER BY id LIMIT {chunk_size}"
+        ), {"last_id": last_id}).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        updates = []
+        for prediction_id, text_value in rows:
+            try:
+                values = json.loads(text_value)
+                packed = contributions.pack(list(values.values()))
+            except (ValueError, TypeError, AttributeError):
+                continue  # Unreadable rows keep their text
+            names = tuple(values)
+            if names not in schema_ids:
+                schema_ids[names] = contributions.schema_id(names, conn)
+            updates.append({"id": prediction_id, "packed": packed, "schema_id": schema_ids[names]})
+        if updates:
+            conn.execute(text(
+                "UPDATE predictions SET contributions_packed = :packed, feature_schema_id = :schema_id,"
+                " feature_contributions = NULL WHERE id = :id"
+            ), updates)
+
+def run(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        _add_missing_columns(conn)
+        _create_missing_indexes(conn)
+        _backfill_latest_predictions(conn)
+        _backfill_feature_fingerprints(conn)
+        _pack_legacy_contributions(conn)
+
+if __name__ == "__main__":
+    run()
+    print(f"Schema up to date: {', '.join(sorted(inspect(engine).get_table_names()))}")
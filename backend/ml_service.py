@@ -1,52 +1,371 @@
-import joblib
+import json
 import pandas as pd
 import numpy as np
 import os
 import random
+import threading
+import time
+from datetime import datetime
+from cache import LRUCache
+from explain import TreeExplainer
+from instrumentation import stage
+from risk_grid import RiskGrid, grid_paths, model_fingerprint
+from tree_engine import FlatForest
+import drift
+import model_format
+from model_format import probe_features as _probe_features
+import model_registry
 
+# Used when the registry has no active version
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "../ml/model.pkl")
+# Serve model.flat (memory-mapped) when it sits next to the pickle and matches it
+FLAT_MODELS = os.getenv("EARLYWARN_FLAT_MODELS", "1") == "1"
+GRID_MODE = os.getenv("EARLYWARN_GRID_MODE", "off") # off | nearest | interpolate
+WATCH_INTERVAL = float(os.getenv("EARLYWARN_MODEL_WATCH_INTERVAL", "5"))
+
+# Served when the model version has no metrics.json
+LEGACY_METRICS_PATH = os.path.join(os.path.dirname(__file__), "metrics.json")
+DEFAULT_METRICS = {"accuracy": 0.0, "precision": 0.0, "recall": 0.0, "f1_score": 0.0, "last_trained": "Never"}
 
-# Global variables for model
-_model = None
 _feature_names = ['gpa', 'attendance_rate', 'assignments_completed', 'household_income_bracket', 'parent_education_level']
 
-def load_model():
-    global _model
-    if os.path.exists(MODEL_PATH):
-        try:
-            _model = joblib.load(MODEL_PATH)
-            print(f"Model loaded from {MODEL_PATH}")
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            _model = None
-    else:
-        print(f"Model file not found at {MODEL_PATH}. Using mock logic.")
-        _model = None
+def _risk_level(prob):
+    return "High" if prob > 0.7 else ("Medium" if prob > 0.4 else "Low")
 
-def predict_risk(gpa, attendance, assignments, income, education):
-    if _model is None:
+def _load_metrics(path):
+    """Evaluation metrics of a model version, read once when its bundle is built."""
+    for candidate in (path, LEGACY_METRICS_PATH):
+        if candidate is not None and os.path.exists(candidate):
+            with open(candidate) as f:
+                return json.load(f)
+    return dict(DEFAULT_METRICS)
+
+class MockBundle:
+    """Stand-in used when no model artifact can be loaded."""
+    version = "mock"
+    path = None
+    format = None
+    metrics_path = None
+    drift_reference = None
+    loaded_at = None
+
+    def __init__(self):
+        self.metrics = _load_metrics(None)
+
+    def predict_risk(self, gpa, attendance, assignments, income, education):
         # Fallback Mock Logic
         risk_score = 0
         if gpa < 2.0: risk_score += 0.4
         if attendance < 0.8: risk_score += 0.3
         if assignments < 5: risk_score += 0.2
-        
+
         prob = min(risk_score + random.uniform(0, 0.1), 1.0)
-        risk = "High" if prob > 0.7 else ("Medium" if prob > 0.4 else "Low")
-        return risk, prob, {"Mock": 1.0}
-
-    # Prepare input
-    data = pd.DataFrame([[gpa, attendance, assignments, income, education]], columns=_feature_names)
-    
-    # Predict
-    prob = _model.predict_proba(data)[0][1] # Probability of Class 1 (Risk)
-    risk = "High" if prob > 0.7 else ("Medium" if prob > 0.4 else "Low")
-    
-    # Explainability (simple feature importance lookup for now)
-    importances = _model.feature_importances_
-    contributions = {name: float(imp) for name, imp in zip(_feature_names, importances)}
-    
-    return risk, prob, contributions
+        return _risk_level(prob), prob, {"Mock": 1.0}
+
+    contribution_names = ("Mock",)
+
+    def predict_risk_batch(self, features, as_matrix=False):
+        # Vectorized version of predict_risk
+        risk_score = (
+            0.4 * (features[:, 0] < 2.0)
+            + 0.3 * (features[:, 1] < 0.8)
+            + 0.2 * (features[:, 2] < 5)
+        )
+        probs = np.minimum(risk_score + np.random.uniform(0, 0.1, len(features)), 1.0)
+        contributions = np.ones((len(probs), 1)) if as_matrix else [{"Mock": 1.0} for _ in probs]
+        return [_risk_level(p) for p in probs], probs, contributions
+
+class ModelBundle:
+    """Everything needed to serve one model version.
+
+    Bundles are immutable once built; a reload builds a new one and swaps the
+    module-level reference, so a request always sees a single consistent version.
+    """
+
+    def __init__(self, version, path):
+        self.version = version
+        self.path = path
+        self.fingerprint = model_fingerprint(path)
+        flat = _load_flat(path, self.fingerprint) if FLAT_MODELS else None
+        self.format = "flat" if flat is not None else "pickle"
+        if flat is not None:
+            self.model = None
+            self.engine = flat.forest
+            self.explainer = flat.explainer or _build_explainer(self.engine)
+            self.importances = flat.importances
+        else:
+            import joblib
+            self.model = joblib.load(path)
+            self.engine = _build_engine(self.model)
+            self.explainer = _build_explainer(self.engine)
+            # feature_importances_ is recomputed by sklearn on every access
+            self.importances = {name: float(imp) for name, imp in zip(_feature_names, self.model.feature_importances_)}
+        self.grid = _load_grid(self) if GRID_MODE != "off" else None
+        self.metrics_path = os.path.join(os.path.dirname(path), model_registry.METRICS_FILE)
+        self.metrics = _load_metrics(self.metrics_path)
+        self.drift_reference = drift.load_reference(os.path.dirname(path))
+        self.loaded_at = datetime.utcnow()
+
+    def _predict_proba(self, features):
+        if self.grid is not None:
+            return self.grid.predict_proba(features, interpolate=GRID_MODE == "interpolate")
+        if self.engine is not None:
+            return self.engine.predict_proba(features)
+        data = pd.DataFrame(np.atleast_2d(features), columns=_feature_names)
+        return self.model.predict_proba(data)[:, 1]
+
+    def predict_risk(self, gpa, attendance, assignments, income, education):
+        # Predict
+        with stage("model.predict_proba"):
+            if self.grid is not None:
+                prob = self.grid.lookup(gpa, attendance, assignments, income, education, interpolate=GRID_MODE == "interpolate")
+            else:
+                row = np.array([gpa, attendance, assignments, income, education], dtype=np.float32)
+                prob = float(self._predict_proba(row)[0]) # Probability of Class 1 (Risk)
+
+        # Explainability (per-student Shapley values, global importances as a fallback)
+        with stage("model.explain"):
+            if self.explainer is not None:
+                contributions = self.explainer.explain(np.array([[gpa, attendance, assignments, income, education]]))[0]
+            else:
+                contributions = dict(self.importances)
+
+        return _risk_level(prob), prob, contributions
+
+    @property
+    def contribution_names(self):
+        """Feature order of the `as_matrix=True` contributions."""
+        return tuple(self.explainer.feature_names if self.explainer is not None else self.importances)
+
+    def predict_risk_batch(self, features, as_matrix=False):
+        with stage("model.predict_proba_batch"):
+            probs = self._predict_proba(features)
+        with stage("model.explain_batch"):
+            if self.explainer is not None:
+                contributions = self.explainer.shap_values(features)
+            else:
+                contributions = np.tile(list(self.importances.values()), (len(probs), 1))
+            if not as_matrix:
+                names = self.contribution_names
+                contributions = [dict(zip(names, row)) for row in contributions.tolist()]
+        return [_risk_level(p) for p in probs], probs, contributions
+
+    def warm(self):
+        """Exercise the hot paths once so the first real request pays no setup cost."""
+        probe = _probe_features(64)
+        self.predict_risk_batch(probe)
+        for row in probe[:8]:
+            self.predict_risk(*row)
+
+_bundle = MockBundle()
+_reload_lock = threading.Lock()
+_reload_status = {"state": "idle", "error": None, "started_at": None, "finished_at": None}
+_failed_version = None  # Registry version whose last load failed
+
+# Memoized predictions for the what-if simulator, keyed on (model version, features)
+_prediction_cache = LRUCache(
+    maxsize=int(os.getenv("EARLYWARN_SIM_CACHE_SIZE", "65536")),
+    ttl=float(os.getenv("EARLYWARN_SIM_CACHE_TTL", "3600")),
+)
+
+def _load_grid(bundle):
+    grid_path = os.path.join(os.path.dirname(bundle.path), "risk_grid") # risk_grid.npy + risk_grid.json
+    if not all(os.path.exists(path) for path in grid_paths(grid_path)):
+        print(f"Grid mode '{GRID_MODE}' requested but no grid at {grid_path}. Using the model.")
+        return None
+    grid = RiskGrid.load(grid_path)
+    if grid.model_version != bundle.fingerprint:
+        print(f"Risk grid was built for model {grid.model_version}, not {bundle.fingerprint}. Using the model.")
+        return None
+    print(f"Risk grid loaded from {grid_path} ({grid.nbytes / 1e6:.1f} MB, mode={GRID_MODE})")
+    return grid
+
+def _load_flat(path, fingerprint):
+    """The memory-mapped model.flat beside `path`, or None to load the pickle."""
+    flat_path = model_format.flat_path(path)
+    if not os.path.exists(flat_path):
+        return None
+    try:
+        flat = model_format.load(flat_path)
+    except Exception as e:
+        print(f"Could not read {flat_path} ({e}). Loading the pickle.")
+        return None
+    if flat.fingerprint != fingerprint or flat.forest.feature_names != _feature_names:
+        print(f"{flat_path} was built for model {flat.fingerprint}, not {fingerprint}. Loading the pickle.")
+        return None
+    return flat
+
+def _build_engine(model, tolerance=1e-9):
+    """Flatten the model and check it against sklearn on a random probe."""
+    try:
+        engine = FlatForest.from_sklearn(model, feature_names=_feature_names)
+    except Exception as e:
+        print(f"Flat tree engine unavailable ({e}). Falling back to sklearn inference.")
+        return None
+
+    probe = _probe_features(256)
+    expected = model.predict_proba(pd.DataFrame(probe, columns=_feature_names))[:, 1]
+    error = np.abs(engine.predict_proba(probe) - expected).max()
+    if error > tolerance:
+        print(f"Flat tree engine disagrees with sklearn (max error {error:.2e}). Falling back to sklearn inference.")
+        return None
+    return engine
+
+def _build_explainer(engine):
+    if engine is None:
+        return None
+    try:
+        return TreeExplainer(engine)
+    except Exception as e:
+        print(f"Shapley explainer unavailable ({e}). Falling back to feature importances.")
+        return None
+
+def _resolve_model():
+    """(version, path) of the model to serve: the registry's CURRENT, else MODEL_PATH."""
+    version = model_registry.current_version()
+    if version is not None:
+        return version, os.path.join(model_registry.version_dir(version), model_registry.MODEL_FILE)
+    if os.path.exists(MODEL_PATH):
+        return None, MODEL_PATH
+    return None, None
+
+def get_bundle():
+    return _bundle
+
+def load_model():
+    """Load the active model, warm it and swap it in.
+
+    Raises if the model can't be loaded; the previously served bundle stays in place.
+    """
+    global _bundle
+    version, path = _resolve_model()
+    if path is None:
+        print(f"Model file not found at {MODEL_PATH}. Using mock logic.")
+        _bundle = MockBundle()
+        _prediction_cache.clear()
+        return _bundle
+
+    bundle = ModelBundle(version, path)
+    if version is None:
+        bundle.version = bundle.fingerprint
+    bundle.warm()
+
+    # A single reference assignment is atomic; in-flight requests finish on the old bundle
+    _bundle = bundle
+    _prediction_cache.clear()
+    print(f"Model {bundle.version} loaded from {path}")
+    return bundle
+
+def reload_model(version=None):
+    """Optionally activate `version`, then load it. Serialized across callers.
+
+    A failure leaves the previous bundle serving and is reported by `reload_status`.
+    """
+    global _failed_version
+    with _reload_lock:
+        _reload_status.update(state="loading", error=None, started_at=datetime.utcnow(), finished_at=None)
+        previous = _bundle
+        target = version or model_registry.current_version()
+        try:
+            if version is not None:
+                model_registry.activate(version)
+            load_model()
+            _failed_version = None
+            _reload_status.update(state="idle")
+        except Exception as e:
+            # Point the registry back at what is actually being served
+            if version is not None and previous.version in model_registry.list_versions():
+                model_registry.activate(previous.version)
+            _failed_version = target
+            print(f"Error loading model {target}: {e}")
+            _reload_status.update(state="failed", error=f"{e}; still serving {previous.version}")
+        finally:
+            _reload_status["finished_at"] = datetime.utcnow()
+    return _bundle
+
+def ensure_current():
+    """Reload if the registry's active version differs from the served one.
+
+    Long-lived worker processes call this so they don't keep scoring with the
+    model they forked with. A version that already failed to load is not retried
+    until the registry points somewhere else.
+    """
+    current = model_registry.current_version()
+    if current is not None and current != _bundle.version and current != _failed_version:
+        reload_model()
+    return _bundle
+
+def reload_model_async(version=None):
+    """Start `reload_model` on a background thread. Returns False if one is running."""
+    if _reload_lock.locked():
+        return False
+    threading.Thread(target=reload_model, args=(version,), name="model-reload", daemon=True).start()
+    return True
+
+def reload_status():
+    return dict(_reload_status)
+
+def _watch_registry(interval):
+    seen = model_registry.current_version()
+    while True:
+        time.sleep(interval)
+        current = model_registry.current_version()
+        if current != seen and current != _bundle.version:
+            print(f"Registry now points at {current}; reloading")
+            reload_model()
+        seen = current
+
+def start_watcher(interval=WATCH_INTERVAL):
+    """Poll the registry's CURRENT pointer and hot-swap when it changes."""
+    thread = threading.Thread(target=_watch_registry, args=(interval,), name="model-watch", daemon=True)
+    thread.start()
+    return thread
+
+def predict_risk(gpa, attendance, assignments, income, education):
+    return _bundle.predict_risk(gpa, attendance, assignments, income, education)
+
+def _cache_key(version, gpa, attendance, assignments, income, education):
+    # The UI sends GPA and attendance with two decimals and the rest as integers
+    return (
+        version,
+        round(float(gpa), 2),
+        round(float(attendance), 2),
+        int(assignments),
+        int(income),
+        int(education),
+    )
+
+def predict_risk_cached(gpa, attendance, assignments, income, education):
+    """`predict_risk` memoized on the canonicalized feature tuple.
+
+    Mock predictions are random and never cached.
+    """
+    bundle = _bundle
+    if isinstance(bundle, MockBundle):
+        return bundle.predict_risk(gpa, attendance, assignments, income, education)
+
+    key = _cache_key(bundle.version, gpa, attendance, assignments, income, education)
+    cached = _prediction_cache.get(key)
+    if cached is None:
+        cached = bundle.predict_risk(*key[1:])
+        _prediction_cache.set(key, cached)
+    risk, prob, contributions = cached
+    return risk, prob, dict(contributions)
+
+def cache_stats():
+    return {"model_version": _bundle.version, **_prediction_cache.stats()}
+
+def predict_risk_batch(features, bundle=None, as_matrix=False):
+    """Score an (n, 5) array of features, columns ordered as `_feature_names`.
+
+    Returns (risk_levels, probabilities, contributions) with one contributions
+    dict per row, as returned by `predict_risk`, or with `as_matrix=True` an
+    (n, len(bundle.contribution_names)) array.
+    """
+    return (bundle or _bundle).predict_risk_batch(np.asarray(features, dtype=np.float64), as_matrix=as_matrix)
 
 # Initialize
-load_model()
+try:
+    load_model()
+except Exception as e:
+    print(f"Error loading model: {e}. Using mock logic.")
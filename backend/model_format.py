@@ -0,0 +1,235 @@
+"""Flat binary model files that load by memory-mapping.
+
+A pickled forest has to be unpickled (and scikit-learn imported) by every
+worker, and each worker ends up with a private copy. `export` writes the
+flattened forest as raw NumPy arrays behind a JSON header:
+
+    8 bytes   magic b"EWFLAT\\x00\\x01"
+    8 bytes   header length, little-endian uint64
+    header    JSON: format version, metadata, {name: dtype, shape, offset}
+    arrays    raw C-order data, each aligned to 64 bytes
+
+`load` maps the file read-only and returns array views into it, so loading is
+a header parse and workers on the same host share the pages through the OS
+page cache. The header records the fingerprint of the model.pkl it was built
+from; callers use it to detect a stale file and fall back to pickle.
+
+The explainer's precomputed leaf table is several times the size of the forest,
+so it goes in model.explain beside model.flat, in the same format. It is
+optional: without it the service builds the table at load time.
+
+Usage:
+    python model_format.py ../ml/model.pkl      # writes ../ml/model.flat and model.explain
+    python model_format.py --no-explainer ../ml/model.pkl
+    python model_format.py --registry           # every registry version without one
+"""
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+from explain import TreeExplainer
+from risk_grid import model_fingerprint
+from tree_engine import FlatForest
+import model_registry
+
+MAGIC = b"EWFLAT\x00\x01"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+class UnsupportedModel(ValueError):
+    """The estimator has no flat representation; keep serving the pickle."""
+
+def flat_path(model_path):
+    """model.pkl -> model.flat in the same directory."""
+    return os.path.join(os.path.dirname(model_path), model_registry.FLAT_MODEL_FILE)
+
+def explainer_path(flat_path):
+    """model.flat -> model.explain, the Shapley table that goes with it."""
+    return os.path.splitext(flat_path)[0] + ".explain"
+
+def probe_features(n, seed=0):
+    """Plausible feature rows for checking a flattened forest against its estimator."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(0.0, 4.0, n).round(2),
+        rng.uniform(0.5, 1.0, n).round(2),
+        rng.integers(0, 21, n),
+        rng.integers(1, 5, n),
+        rng.integers(1, 5, n),
+    ])
+
+def _pad(offset):
+    return -offset % ALIGNMENT
+
+def write(path, arrays, meta):
+    """Write `arrays` ({name: ndarray}) and the JSON-serializable `meta` atomically."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps({"format_version": FORMAT_VERSION, **meta, "arrays": layout}).encode()
+    # Array offsets are relative to the aligned end of the header
+    data_start = len(MAGIC) + 8 + len(header)
+    data_start += _pad(data_start)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".flat-", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            f.write(b"\0" * (data_start - f.tell()))
+            for array in arrays.values():
+                f.write(array.data)
+                f.write(b"\0" * _pad(array.nbytes))
+        os.chmod(tmp_path, 0o644)  # mkstemp creates it owner-only
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+def read(path, mmap=True):
+    """(header, {name: read-only ndarray}) from a file written by `write`."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat model file")
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {header.get('format_version')}, expected {FORMAT_VERSION}")
+
+    data_start = len(MAGIC) + 8 + header_length
+    data_start += _pad(data_start)
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        with open(path, "rb") as f:
+            buffer = np.frombuffer(f.read(), dtype=np.uint8)
+    arrays = {
+        name: np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=buffer,
+                         offset=data_start + spec["offset"])
+        for name, spec in header["arrays"].items()
+    }
+    return header, arrays
+
+def export(model, path, feature_names, fingerprint=None, tolerance=1e-9, explainer=True):
+    """Flatten a fitted forest into `path`, and with `explainer` its Shapley table beside it.
+
+    Raises UnsupportedModel when the estimator can't be flattened or the
+    flattened forest disagrees with the estimator on the service's probe.
+    """
+
+    try:
+        forest = FlatForest.from_sklearn(model, feature_names=feature_names)
+    except Exception as e:
+        raise UnsupportedModel(f"{type(model).__name__} can't be flattened ({e})")
+
+    # The same probe ml_service checks pickled forests with
+    probe = probe_features(256)[:, :len(feature_names)]
+    import pandas as pd
+    expected = model.predict_proba(pd.DataFrame(probe, columns=feature_names))[:, 1]
+    error = float(np.abs(forest.predict_proba(probe) - expected).max())
+    if error > tolerance:
+        raise UnsupportedModel(f"Flattened forest disagrees with {type(model).__name__} (max error {error:.2e})")
+
+    arrays = {f"forest.{name}": array for name, array in forest.arrays().items()}
+    meta = {
+        "estimator": type(model).__name__,
+        "model_fingerprint": fingerprint,
+        "feature_names": forest.feature_names,
+        "max_depth": forest.max_depth,
+        "n_trees": forest.n_trees,
+        "importances": [float(v) for v in getattr(model, "feature_importances_", [])],
+    }
+    table_path = explainer_path(path)
+    if os.path.exists(table_path):
+        os.unlink(table_path)  # Never leave a table from an older model beside this one
+    if explainer:
+        try:
+            explainer = TreeExplainer(forest)
+        except Exception as e:
+            print(f"Shapley explainer not exported ({e}); it will be built at load time.")
+        else:
+            write(table_path, explainer.arrays(), {
+                "model_fingerprint": fingerprint,
+                "feature_names": forest.feature_names,
+                "n_trees": forest.n_trees,
+                "expected_value": explainer.expected_value,
+            })
+    return write(path, arrays, meta)
+
+def export_file(model_path, feature_names=None, explainer=True):
+    """Export the pickled model at `model_path` to model.flat beside it."""
+    import joblib
+    from training import FEATURES
+
+    model = joblib.load(model_path)
+    return export(model, flat_path(model_path), feature_names or FEATURES, model_fingerprint(model_path),
+                  explainer=explainer)
+
+class FlatModel:
+    """A memory-mapped model: forest, optional explainer and header metadata."""
+
+    def __init__(self, header, arrays):
+        self.header = header
+        forest_arrays = {name.split(".", 1)[1]: a for name, a in arrays.items() if name.startswith("forest.")}
+        self.forest = FlatForest.from_arrays(forest_arrays, header["max_depth"], header["feature_names"])
+        self.explainer = None
+        self.nbytes = sum(a.nbytes for a in arrays.values())
+
+    def load_explainer(self, path, mmap=True):
+        """Attach the Shapley table at `path` if it was exported with this forest."""
+        try:
+            header, arrays = read(path, mmap=mmap)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {path} ({e}). The explainer will be rebuilt.")
+            return
+        if header.get("model_fingerprint") != self.fingerprint or header["feature_names"] != self.header["feature_names"]:
+            print(f"{path} was built for model {header.get('model_fingerprint')}, not {self.fingerprint}. Ignoring it.")
+            return
+        self.explainer = TreeExplainer.from_arrays(
+            arrays, header["feature_names"], header["n_trees"], header["expected_value"],
+        )
+        self.nbytes += sum(a.nbytes for a in arrays.values())
+
+    @property
+    def fingerprint(self):
+        return self.header.get("model_fingerprint")
+
+    @property
+    def importances(self):
+        return dict(zip(self.header["feature_names"], self.header["importances"]))
+
+def load(path, mmap=True, explainer=True):
+    """The FlatModel at `path`, with its model.explain table when `explainer` is set and one exists."""
+    flat = FlatModel(*read(path, mmap=mmap))
+    table_path = explainer_path(path)
+    if explainer and os.path.exists(table_path):
+        flat.load_explainer(table_path, mmap=mmap)
+    return flat
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export pickled forests to the flat model format.")
+    parser.add_argument("models", nargs="*", help="model.pkl files; model.flat is written beside each")
+    parser.add_argument("--registry", action="store_true", help="Export every registry version lacking a model.flat")
+    parser.add_argument("--no-explainer", action="store_true", help="Skip model.explain; the service builds it at load")
+    args = parser.parse_args()
+
+    paths = list(args.models)
+    if args.registry:
+        for version in model_registry.list_versions():
+            model_path = os.path.join(model_registry.version_dir(version), model_registry.MODEL_FILE)
+            if not os.path.exists(flat_path(model_path)):
+                paths.append(model_path)
+    if not paths:
+        parser.error("nothing to export")
+    for model_path in paths:
+        try:
+            out = export_file(model_path, explainer=not args.no_explainer)
+        except UnsupportedModel as e:
+            print(f"Skipped {model_path}: {e}")
+            continue
+        print(f"Wrote {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
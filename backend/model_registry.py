@@ -0,0 +1,111 @@
+"""Versioned model artifacts on disk.
+
+    <registry>/
+        CURRENT                      # name of the active version
+        20260212T094421-1a2b3c4d5e6f/
+            model.pkl
+            model.flat                   # optional memory-mappable copy (model_format.py)
+            model.explain                # optional Shapley table for model.flat
+            metrics.json
+            ...                      # any other per-version artifacts
+
+Versions are staged in a hidden directory and renamed into place, and CURRENT
+is replaced atomically, so readers never see a half-written version.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py import ../ml/model.pkl [--metrics metrics.json] [--activate]
+    python model_registry.py activate <version>
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from risk_grid import model_fingerprint
+
+REGISTRY_DIR = os.getenv(
+    "EARLYWARN_MODEL_REGISTRY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../ml/registry"),
+)
+MODEL_FILE = "model.pkl"
+FLAT_MODEL_FILE = "model.flat"
+METRICS_FILE = "metrics.json"
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+CURRENT_FILE = "CURRENT"
+
+def version_dir(version, registry_dir=None):
+    return os.path.join(registry_dir or REGISTRY_DIR, version)
+
+def list_versions(registry_dir=None):
+    registry_dir = registry_dir or REGISTRY_DIR
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if not name.startswith(".") and os.path.isfile(os.path.join(registry_dir, name, MODEL_FILE))
+    )
+
+def current_version(registry_dir=None):
+    path = os.path.join(registry_dir or REGISTRY_DIR, CURRENT_FILE)
+    try:
+        with open(path) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+def activate(version, registry_dir=None):
+    """Point CURRENT at `version` (atomic replace)."""
+    registry_dir = registry_dir or REGISTRY_DIR
+    if version not in list_versions(registry_dir):
+        raise ValueError(f"Unknown model version: {version}")
+    fd, tmp_path = tempfile.mkstemp(prefix=".current-", dir=registry_dir)
+    with os.fdopen(fd, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(registry_dir, CURRENT_FILE))
+
+def stage(registry_dir=None):
+    """Create an empty staging directory for a new version's artifacts."""
+    registry_dir = registry_dir or REGISTRY_DIR
+    os.makedirs(registry_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".staging-", dir=registry_dir)
+
+def commit(staging_dir, activate_version=True, registry_dir=None):
+    """Turn a staging directory into a named version and optionally activate it."""
+    registry_dir = registry_dir or REGISTRY_DIR
+    model_path = os.path.join(staging_dir, MODEL_FILE)
+    if not os.path.isfile(model_path):
+        raise ValueError(f"{staging_dir} has no {MODEL_FILE}")
+
+    version = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{model_fingerprint(model_path)}"
+    os.rename(staging_dir, version_dir(version, registry_dir))
+    if activate_version:
+        activate(version, registry_dir)
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the model registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    import_parser = sub.add_parser("import", help="Register an existing model.pkl")
+    import_parser.add_argument("model")
+    import_parser.add_argument("--metrics")
+    import_parser.add_argument("--activate", action="store_true")
+    activate_parser = sub.add_parser("activate")
+    activate_parser.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        current = current_version()
+        for name in list_versions():
+            print(f"{'*' if name == current else ' '} {name}")
+    elif args.command == "import":
+        staging = stage()
+        shutil.copyfile(args.model, os.path.join(staging, MODEL_FILE))
+        if args.metrics:
+            shutil.copyfile(args.metrics, os.path.join(staging, METRICS_FILE))
+        print(f"Registered {commit(staging, activate_version=args.activate)}")
+    else:
+        activate(args.version)
+        print(f"Activated {args.version}")
@@ -1,8 +1,23 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+import hashlib
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, LargeBinary, event
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
 
+# Model inputs, in the order the model expects them
+FEATURE_FIELDS = ("gpa", "attendance_rate", "assignments_completed", "household_income_bracket", "parent_education_level")
+
+def feature_fingerprint(gpa, attendance_rate, assignments_completed, household_income_bracket, parent_education_level):
+    """Short hash of a student's model inputs; equal fingerprints score identically."""
+    values = (
+        None if gpa is None else float(gpa),
+        None if attendance_rate is None else float(attendance_rate),
+        None if assignments_completed is None else int(assignments_completed),
+        None if household_income_bracket is None else int(household_income_bracket),
+        None if parent_education_level is None else int(parent_education_level),
+    )
+    return hashlib.blake2b("|".join(map(repr, values)).encode(), digest_size=8).hexdigest()
+
 class Student(Base):
     __tablename__ = "students"
 
@@ -16,9 +31,19 @@ class Student(Base):
     # Socio-economic Data (Use broad categories)
     household_income_bracket = Column(Integer) # 1: Low, 2: Med, 3: High
     parent_education_level = Column(Integer) # 1: HS, 2: College, 3: Post-grad
+    # Observed outcome (1: at risk, 0: not), NULL when unknown. Training label only.
+    at_risk = Column(Integer, nullable=True)
+    # feature_fingerprint() of the columns above; kept current on every write so
+    # scoring can skip students whose inputs haven't changed
+    feature_fingerprint = Column(String, nullable=True)
     
     predictions = relationship("Prediction", back_populates="student")
 
+@event.listens_for(Student, "before_insert")
+@event.listens_for(Student, "before_update")
+def _set_feature_fingerprint(mapper, connection, student):
+    student.feature_fingerprint = feature_fingerprint(*(getattr(student, field) for field in FEATURE_FIELDS))
+
 class Prediction(Base):
     __tablename__ = "predictions"
 
@@ -27,12 +52,136 @@ class Prediction(Base):
     risk_level = Column(String) # 'Low', 'Medium', 'High'
     probability = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    model_version = Column(String, nullable=True)
     
-    # Feature Importance (JSON stored as text for simplicity related to DB portability)
-    feature_contributions = Column(String) 
+    # Feature contributions as packed float32 (see contributions.py), ordered by the feature schema
+    contributions_packed = Column(LargeBinary, nullable=True)
+    feature_schema_id = Column(Integer, ForeignKey("feature_schemas.id"), nullable=True)
+    # Legacy JSON text of the same dict; migrations.py packs it into the columns above
+    feature_contributions_json = Column("feature_contributions", String, nullable=True)
 
     student = relationship("Student", back_populates="predictions")
 
+    @property
+    def contributions(self):
+        """{feature: contribution}, decoded on access."""
+        import contributions
+        return contributions.decode(self.contributions_packed, self.feature_schema_id, self.feature_contributions_json)
+
+    @property
+    def feature_contributions(self):
+        return self.contributions
+
+    __table_args__ = (
+        Index("ix_predictions_student_id_timestamp", "student_id", "timestamp"),
+    )
+
+class FeatureSchema(Base):
+    """An ordered list of feature names that packed contributions refer to."""
+    __tablename__ = "feature_schemas"
+
+    id = Column(Integer, primary_key=True)
+    feature_names = Column(String, unique=True) # JSON list, in model order
+
+class LatestPrediction(Base):
+    """Most recent prediction per student, upserted whenever predictions are stored."""
+    __tablename__ = "latest_predictions"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    prediction_id = Column(Integer, ForeignKey("predictions.id"))
+    risk_level = Column(String)
+    probability = Column(Float)
+    timestamp = Column(DateTime)
+    # What the prediction was computed from; a match means rescoring is redundant
+    model_version = Column(String, nullable=True)
+    feature_fingerprint = Column(String, nullable=True)
+
+    student = relationship("Student")
+
+    __table_args__ = (
+        Index("ix_latest_predictions_risk_level_probability", "risk_level", "probability"),
+    )
+
+class DailyRiskRollup(Base):
+    """Per-student, per-day aggregate of predictions, maintained by risk_history.refresh_rollups."""
+    __tablename__ = "daily_risk_rollups"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer)
+    probability_sum = Column(Float)
+    probability_min = Column(Float)
+    probability_max = Column(Float)
+    # Latest prediction of the day
+    last_probability = Column(Float)
+    last_risk_level = Column(String)
+    last_timestamp = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_daily_risk_rollups_day", "day"),
+    )
+
+class RollupState(Base):
+    """High-water mark of the predictions already folded into a rollup table."""
+    __tablename__ = "rollup_state"
+
+    name = Column(String, primary_key=True)
+    last_prediction_id = Column(Integer, default=0)
+    # JSON [[low id, high id, first seen (epoch seconds)], ...]: ids below the mark that
+    # were not visible yet when it moved past them (uncommitted, or rolled back)
+    gaps = Column(String, nullable=True)
+
+class FeatureDriftCount(Base):
+    """Scored feature values per drift reference bin, summed by drift.DriftMonitor.flush."""
+    __tablename__ = "feature_drift_counts"
+
+    model_version = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    feature = Column(String, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0)
+
+class ScoringJob(Base):
+    __tablename__ = "scoring_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="queued") # 'queued', 'running', 'completed', 'failed'
+    shard_size = Column(Integer)
+    shard_count = Column(Integer, default=0)
+    completed_shards = Column(Integer, default=0)
+    failed_shards = Column(Integer, default=0)
+    total_students = Column(Integer, default=0)
+    scored = Column(Integer, default=0)
+    skipped = Column(Integer, default=0) # Unchanged since their last prediction
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    owner = Column(String, nullable=True) # "host:pid" of the process whose pool runs the shards
+
+    shards = relationship("ScoringJobShard", back_populates="job", order_by="ScoringJobShard.start_id")
+
+    @property
+    def progress(self):
+        return self.completed_shards / self.shard_count if self.shard_count else 1.0
+
+class ScoringJobShard(Base):
+    __tablename__ = "scoring_job_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("scoring_jobs.id"), index=True)
+    start_id = Column(Integer) # Inclusive range of Student.id
+    end_id = Column(Integer)
+    status = Column(String, default="queued")
+    scored = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    high_risk = Column(Integer, default=0)
+    medium_risk = Column(Integer, default=0)
+    low_risk = Column(Integer, default=0)
+    duration_ms = Column(Float, nullable=True)
+    error = Column(String, nullable=True)
+
+    job = relationship("ScoringJob", back_populates="shards")
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,274 @@
+"""Precomputed risk lookup table over the (quantized) feature grid.
+
+GPA and attendance are reported with two decimals and the other three features
+are small integers, so the whole input space fits in a dense table. The table
+is saved as a plain `.npy` file (memory-mappable) next to a JSON header that
+describes the axes and the model it was built from.
+
+Usage:
+    python risk_grid.py build  --model ../ml/model.pkl [--gpa-step 0.01] [--attendance-step 0.01]
+    python risk_grid.py report --model ../ml/model.pkl
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+FEATURE_NAMES = ['gpa', 'attendance_rate', 'assignments_completed', 'household_income_bracket', 'parent_education_level']
+
+# Table layout: integer axes first, then the two continuous axes, so that the
+# four corners used for interpolation sit next to each other in memory.
+INTEGER_AXES = {
+    'assignments_completed': (0, 20),
+    'household_income_bracket': (1, 4),
+    'parent_education_level': (1, 4),
+}
+CONTINUOUS_AXES = {
+    'gpa': (0.0, 4.0),
+    'attendance_rate': (0.5, 1.0),
+}
+
+def model_fingerprint(path):
+    """Short content hash identifying a model artifact."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def grid_paths(base_path):
+    """`base_path` without extension -> (table .npy path, header .json path)."""
+    return base_path + ".npy", base_path + ".json"
+
+RISK_THRESHOLDS = (0.4, 0.7)
+
+def quantize(probs, dtype=np.float16):
+    """Cast probabilities to `dtype` without moving any across a risk threshold."""
+    probs = np.asarray(probs, dtype=np.float64)
+    out = probs.astype(dtype)
+    for threshold in RISK_THRESHOLDS:
+        t = np.asarray(threshold, dtype=dtype)
+        above = probs > threshold
+        flipped = above != (out.astype(np.float64) > threshold)
+        # nextafter within the narrow dtype puts the value back on the right side
+        out[flipped & above] = np.nextafter(t, np.asarray(1, dtype=dtype))
+        out[flipped & ~above] = t if float(t) <= threshold else np.nextafter(t, np.asarray(0, dtype=dtype))
+    return out
+
+def _axis_points(start, stop, step):
+    size = int(round((stop - start) / step)) + 1
+    return np.round(start + step * np.arange(size), 6)
+
+def build_grid(predict_fn, gpa_step=0.01, attendance_step=0.01, dtype=np.float16):
+    """Evaluate `predict_fn` (n x 5 features -> P(risk)) over the full grid.
+
+    Returns (table, header).
+    """
+    gpa = _axis_points(*CONTINUOUS_AXES['gpa'], gpa_step)
+    attendance = _axis_points(*CONTINUOUS_AXES['attendance_rate'], attendance_step)
+    assignments = np.arange(INTEGER_AXES['assignments_completed'][0], INTEGER_AXES['assignments_completed'][1] + 1)
+    income = np.arange(INTEGER_AXES['household_income_bracket'][0], INTEGER_AXES['household_income_bracket'][1] + 1)
+    education = np.arange(INTEGER_AXES['parent_education_level'][0], INTEGER_AXES['parent_education_level'][1] + 1)
+
+    table = np.empty((len(assignments), len(income), len(education), len(gpa), len(attendance)), dtype=dtype)
+    gpa_mesh, attendance_mesh = (m.ravel() for m in np.meshgrid(gpa, attendance, indexing='ij'))
+    plane = np.empty((len(gpa_mesh), 5))
+    plane[:, 0] = gpa_mesh
+    plane[:, 1] = attendance_mesh
+
+    # One predict call per (assignments, income, education) plane
+    for a_idx, a in enumerate(assignments):
+        for i_idx, inc in enumerate(income):
+            for e_idx, edu in enumerate(education):
+                plane[:, 2:] = (a, inc, edu)
+                table[a_idx, i_idx, e_idx] = quantize(predict_fn(plane), dtype).reshape(len(gpa), len(attendance))
+
+    header = {
+        "format": 1,
+        "dtype": np.dtype(dtype).name,
+        "shape": list(table.shape),
+        "axes": [
+            {"name": "assignments_completed", "start": int(assignments[0]), "step": 1, "size": len(assignments)},
+            {"name": "household_income_bracket", "start": int(income[0]), "step": 1, "size": len(income)},
+            {"name": "parent_education_level", "start": int(education[0]), "step": 1, "size": len(education)},
+            {"name": "gpa", "start": float(gpa[0]), "step": gpa_step, "size": len(gpa)},
+            {"name": "attendance_rate", "start": float(attendance[0]), "step": attendance_step, "size": len(attendance)},
+        ],
+    }
+    return table, header
+
+def save_grid(table, header, base_path):
+    table_path, header_path = grid_paths(base_path)
+    np.save(table_path, table)
+    with open(header_path, "w") as f:
+        json.dump(header, f, indent=2)
+    return table_path, header_path
+
+class RiskGrid:
+    """O(1) risk lookups against a table written by `save_grid`."""
+
+    def __init__(self, table, header):
+        self.table = table
+        self.header = header
+        axes = {axis["name"]: axis for axis in header["axes"]}
+        # Column order follows FEATURE_NAMES
+        self._start = np.array([axes[name]["start"] for name in FEATURE_NAMES], dtype=np.float64)
+        self._step = np.array([axes[name]["step"] for name in FEATURE_NAMES], dtype=np.float64)
+        self._last = np.array([axes[name]["size"] - 1 for name in FEATURE_NAMES], dtype=np.int64)
+
+    @classmethod
+    def load(cls, base_path, mmap=True):
+        table_path, header_path = grid_paths(base_path)
+        with open(header_path) as f:
+            header = json.load(f)
+        table = np.load(table_path, mmap_mode="r" if mmap else None)
+        return cls(table, header)
+
+    @property
+    def model_version(self):
+        return self.header.get("model_version")
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def lookup(self, gpa, attendance, assignments, income, education, interpolate=False):
+        """Scalar fast path of `predict_proba` for a single student."""
+        last = self._last
+        a = min(max(int(round((assignments - self._start[2]) / self._step[2])), 0), last[2])
+        i = min(max(int(round((income - self._start[3]) / self._step[3])), 0), last[3])
+        e = min(max(int(round((education - self._start[4]) / self._step[4])), 0), last[4])
+        g = min(max((gpa - self._start[0]) / self._step[0], 0.0), float(last[0]))
+        t = min(max((attendance - self._start[1]) / self._step[1], 0.0), float(last[1]))
+        plane = self.table[a, i, e]
+
+        if not interpolate:
+            return float(plane[int(round(g)), int(round(t))])
+
+        g0 = min(int(g), max(last[0] - 1, 0))
+        t0 = min(int(t), max(last[1] - 1, 0))
+        g1 = min(g0 + 1, last[0])
+        t1 = min(t0 + 1, last[1])
+        wg = g - g0
+        wt = t - t0
+        return float(plane[g0, t0] * (1 - wg) * (1 - wt) + plane[g0, t1] * (1 - wg) * wt
+                     + plane[g1, t0] * wg * (1 - wt) + plane[g1, t1] * wg * wt)
+
+    def predict_proba(self, X, interpolate=False):
+        """P(risk) for an (n, 5) or (5,) array of features in FEATURE_NAMES order."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        pos = (X - self._start) / self._step
+        idx = np.clip(np.rint(pos), 0, self._last).astype(np.int64)
+        a, i, e = idx[:, 2], idx[:, 3], idx[:, 4]
+
+        if not interpolate:
+            return self.table[a, i, e, idx[:, 0], idx[:, 1]].astype(np.float64)
+
+        # Bilinear interpolation over (gpa, attendance)
+        g = np.clip(pos[:, 0], 0, self._last[0])
+        t = np.clip(pos[:, 1], 0, self._last[1])
+        g0 = np.minimum(np.floor(g).astype(np.int64), max(self._last[0] - 1, 0))
+        t0 = np.minimum(np.floor(t).astype(np.int64), max(self._last[1] - 1, 0))
+        g1 = np.minimum(g0 + 1, self._last[0])
+        t1 = np.minimum(t0 + 1, self._last[1])
+        wg = g - g0
+        wt = t - t0
+        v00 = self.table[a, i, e, g0, t0].astype(np.float64)
+        v01 = self.table[a, i, e, g0, t1].astype(np.float64)
+        v10 = self.table[a, i, e, g1, t0].astype(np.float64)
+        v11 = self.table[a, i, e, g1, t1].astype(np.float64)
+        return (v00 * (1 - wg) * (1 - wt) + v01 * (1 - wg) * wt
+                + v10 * wg * (1 - wt) + v11 * wg * wt)
+
+def _risk_levels(probs):
+    return np.where(probs > 0.7, 2, np.where(probs > 0.4, 1, 0))
+
+def accuracy_report(predict_fn, resolutions=((0.01, 0.01), (0.02, 0.02), (0.05, 0.05), (0.1, 0.05), (0.25, 0.1)),
+                    n_samples=20000, seed=0):
+    """Compare grid lookups against the exact model at several resolutions.
+
+    Only the grid points the samples snap to are evaluated, so the report does
+    not have to build every candidate table.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.uniform(*CONTINUOUS_AXES['gpa'], n_samples).round(2),
+        rng.uniform(*CONTINUOUS_AXES['attendance_rate'], n_samples).round(2),
+        rng.integers(0, 21, n_samples),
+        rng.integers(1, 5, n_samples),
+        rng.integers(1, 5, n_samples),
+    ])
+    exact = predict_fn(X)
+    n_planes = np.prod([hi - lo + 1 for lo, hi in INTEGER_AXES.values()])
+
+    rows = []
+    for gpa_step, attendance_step in resolutions:
+        steps = np.array([gpa_step, attendance_step])
+        starts = np.array([CONTINUOUS_AXES['gpa'][0], CONTINUOUS_AXES['attendance_rate'][0]])
+        sizes = np.array([
+            int(round((CONTINUOUS_AXES['gpa'][1] - starts[0]) / gpa_step)) + 1,
+            int(round((CONTINUOUS_AXES['attendance_rate'][1] - starts[1]) / attendance_step)) + 1,
+        ])
+
+        def at(grid_idx):
+            snapped = X.copy()
+            snapped[:, :2] = np.round(starts + grid_idx * steps, 6)
+            return quantize(predict_fn(snapped)).astype(np.float64)
+
+        pos = np.clip((X[:, :2] - starts) / steps, 0, sizes - 1)
+        nearest = at(np.rint(pos))
+        lo = np.minimum(np.floor(pos), np.maximum(sizes - 2, 0))
+        hi = np.minimum(lo + 1, sizes - 1)
+        w = pos - lo
+        interpolated = (
+            at(lo) * (1 - w[:, 0]) * (1 - w[:, 1])
+            + at(np.column_stack([lo[:, 0], hi[:, 1]])) * (1 - w[:, 0]) * w[:, 1]
+            + at(np.column_stack([hi[:, 0], lo[:, 1]])) * w[:, 0] * (1 - w[:, 1])
+            + at(hi) * w[:, 0] * w[:, 1]
+        )
+
+        row = {
+            "gpa_step": gpa_step,
+            "attendance_step": attendance_step,
+            "cells": int(n_planes * sizes.prod()),
+            "table_mb": float(n_planes * sizes.prod() * 2 / 1e6),
+        }
+        for mode, approx in (("nearest", nearest), ("interpolate", interpolated)):
+            error = np.abs(approx - exact)
+            row[mode] = {
+                "max_abs_error": float(error.max()),
+                "mean_abs_error": float(error.mean()),
+                "risk_level_agreement": float((_risk_levels(approx) == _risk_levels(exact)).mean()),
+            }
+        rows.append(row)
+    return rows
+
+def _load_predict_fn(model_path):
+    import joblib
+    from tree_engine import FlatForest
+
+    engine = FlatForest.from_sklearn(joblib.load(model_path), feature_names=FEATURE_NAMES)
+    return engine.predict_proba
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or evaluate the risk lookup grid.")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), "../ml/model.pkl"))
+    parser.add_argument("--output", help="Base path for the grid files (defaults to <model dir>/risk_grid)")
+    parser.add_argument("--gpa-step", type=float, default=0.01)
+    parser.add_argument("--attendance-step", type=float, default=0.01)
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    predict_fn = _load_predict_fn(args.model)
+    if args.command == "report":
+        print(json.dumps(accuracy_report(predict_fn, n_samples=args.samples), indent=2))
+    else:
+        start = time.perf_counter()
+        table, header = build_grid(predict_fn, args.gpa_step, args.attendance_step)
+        header["model_version"] = model_fingerprint(args.model)
+        base_path = args.output or os.path.join(os.path.dirname(os.path.abspath(args.model)), "risk_grid")
+        table_path, _ = save_grid(table, header, base_path)
+        print(f"Grid {table.shape} ({table.nbytes / 1e6:.1f} MB) saved to {table_path} in {time.perf_counter() - start:.1f}s")
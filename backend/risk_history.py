@@ -0,0 +1,388 @@
+"""Risk trajectories per student and per cohort, read from an incrementally maintained daily rollup."""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import case, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+import database, models
+
+ROLLUP_NAME = "daily_risk_rollups"
+REFRESH_CHUNK_SIZE = 50_000
+BUCKETS = ("raw", "day", "week")
+RISK_LEVELS = ("Low", "Medium", "High")
+# How long an id skipped by the watermark is re-checked before it is taken to be
+# rolled back; must exceed the longest prediction-writing transaction
+GAP_SECONDS = float(os.getenv("EARLYWARN_ROLLUP_GAP_SECONDS", "3600"))
+
+_refresh_lock = threading.Lock()
+
+def _watermark(db: Session):
+    """(last folded id, gaps JSON text) of the rollup, creating its state row if needed."""
+    state = db.execute(
+        select(models.RollupState.last_prediction_id, models.RollupState.gaps).where(models.RollupState.name == ROLLUP_NAME)
+    ).first()
+    if state is None:
+        insert = database.dialect_insert(db.get_bind())(models.RollupState)
+        db.execute(insert.values(name=ROLLUP_NAME, last_prediction_id=0).on_conflict_do_nothing())
+        return 0, None
+    return state.last_prediction_id or 0, state.gaps
+
+def _new_gaps(last_id, ids, now):
+    """Ranges of ids in (last_id, max(ids)] missing from the sorted `ids`."""
+    gaps = []
+    previous = last_id
+    for prediction_id in ids:
+        if prediction_id > previous + 1:
+            gaps.append([previous + 1, prediction_id - 1, now])
+        previous = prediction_id
+    return gaps
+
+def _fill_gaps(gaps, found):
+    """`gaps` minus the sorted ids in `found`."""
+    remaining = []
+    for low, high, seen in gaps:
+        for prediction_id in found:
+            if prediction_id < low or prediction_id > high:
+                continue
+            if prediction_id > low:
+                remaining.append([low, prediction_id - 1, seen])
+            low = prediction_id + 1
+        if low <= high:
+            remaining.append([low, high, seen])
+    return remaining
+
+def _aggregate(rows):
+    """(student_id, day) -> [count, sum, min, max, last probability, last level, last timestamp]."""
+    groups = {}
+    for _, student_id, timestamp, probability, risk_level in rows:
+        if student_id is None or timestamp is None or probability is None:
+            continue
+        key = (student_id, timestamp.date())
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [1, probability, probability, probability, probability, risk_level, timestamp]
+            continue
+        group[0] += 1
+        group[1] += probability
+        group[2] = min(group[2], probability)
+        group[3] = max(group[3], probability)
+        if timestamp >= group[6]:
+            group[4], group[5], group[6] = probability, risk_level, timestamp
+    return groups
+
+def _upsert_statement(db: Session):
+    table = models.DailyRiskRollup
+    stmt = database.dialect_insert(db.get_bind())(table)
+    new = stmt.excluded
+    newer = new.last_timestamp >= table.last_timestamp
+    return stmt.on_conflict_do_update(
+        index_elements=[table.student_id, table.day],
+        set_={
+            "count": table.count + new.count,
+            "probability_sum": table.probability_sum + new.probability_sum,
+            "probability_min": case((new.probability_min < table.probability_min, new.probability_min), else_=table.probability_min),
+            "probability_max": case((new.probability_max > table.probability_max, new.probability_max), else_=table.probability_max),
+            "last_probability": case((newer, new.last_probability), else_=table.last_probability),
+            "last_risk_level": case((newer, new.last_risk_level), else_=table.last_risk_level),
+            "last_timestamp": case((newer, new.last_timestamp), else_=table.last_timestamp),
+        },
+    )
+
+_PREDICTION_COLUMNS = (
+    models.Prediction.id, models.Prediction.student_id, models.Prediction.timestamp,
+    models.Prediction.probability, models.Prediction.risk_level,
+)
+
+def refresh_rollups(db: Session, chunk_size=REFRESH_CHUNK_SIZE):
+    """Fold predictions above the watermark into the daily rollup; returns how many were read.
+
+    Each chunk commits together with its watermark advance. The advance is a
+    compare-and-set, so concurrent refreshes never fold the same rows twice:
+    the loser rolls back and leaves the work to the winner.
+
+    Ids need not become visible in id order (a long Postgres transaction commits
+    ids below ones already folded): ids the watermark skips are kept as gaps and
+    re-checked on every refresh for GAP_SECONDS.
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return 0  # Another thread in this process is already catching up
+    try:
+        folded = 0
+        while True:
+            last_id, gaps_text = _watermark(db)
+            now = int(time.time())
+            gaps = [gap for gap in json.loads(gaps_text or "[]") if now - gap[2] < GAP_SECONDS]
+
+            late = []
+            if gaps:
+                late = db.execute(
+                    select(*_PREDICTION_COLUMNS)
+                    .where(or_(*(models.Prediction.id.between(low, high) for low, high, _ in gaps)))
+                    .order_by(models.Prediction.id)
+                    .limit(chunk_size)
+                ).all()
+            rows = db.execute(
+                select(*_PREDICTION_COLUMNS)
+                .where(models.Prediction.id > last_id)
+                .order_by(models.Prediction.id)
+                .limit(chunk_size)
+            ).all()
+            new_gaps = _fill_gaps(gaps, [row[0] for row in late]) + _new_gaps(last_id, [row[0] for row in rows], now)
+            new_gaps_text = json.dumps(new_gaps) if new_gaps else None
+            if not rows and not late and new_gaps_text == gaps_text:
+                db.commit()
+                return folded
+
+            state = models.RollupState
+            claimed = db.execute(
+                update(state)
+                .where(
+                    state.name == ROLLUP_NAME,
+                    state.last_prediction_id == last_id,
+                    state.gaps.is_not_distinct_from(gaps_text),
+                )
+                .values(last_prediction_id=rows[-1][0] if rows else last_id, gaps=new_gaps_text)
+            ).rowcount
+            if claimed != 1:
+                db.rollback()
+                return folded
+
+            groups = _aggregate(late + rows)
+            if groups:
+                db.execute(_upsert_statement(db), [
+                    {
+                        "student_id": student_id,
+                        "day": day,
+                        "count": count,
+                        "probability_sum": total,
+                        "probability_min": low,
+                        "probability_max": high,
+                        "last_probability": last_probability,
+                        "last_risk_level": last_level,
+                        "last_timestamp": last_timestamp,
+                    }
+                    for (student_id, day), (count, total, low, high, last_probability, last_level, last_timestamp)
+                    in groups.items()
+                ])
+            db.commit()
+            folded += len(late) + len(rows)
+            if not rows and not late:
+                return folded  # Only expired gaps were dropped
+    finally:
+        _refresh_lock.release()
+
+def refresh_pending():
+    """Fold new predictions on a session of its own; failures are logged, not raised.
+
+    Run after predictions are committed, so the history endpoints only read.
+    """
+    db = database.SessionLocal()
+    try:
+        return refresh_rollups(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Risk rollup not refreshed: {e}")
+        return 0
+    finally:
+        db.close()
+
+def rebuild_rollups(db: Session):
+    db.execute(delete(models.DailyRiskRollup))
+    db.execute(delete(models.RollupState).where(models.RollupState.name == ROLLUP_NAME))
+    db.commit()
+    return refresh_rollups(db)
+
+def lttb(x, y, n_out):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps out of len(x)."""
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n) if n <= n_out else np.array([0, n - 1])[:max(n_out, 1)]
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # First and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = [0]
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        # Twice the area of the triangle (previous kept point, candidate, next bucket's mean)
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep.append(a)
+    keep.append(n - 1)
+    return np.array(keep)
+
+def _downsample(points, max_points):
+    if max_points is None or len(points) <= max_points:
+        return points
+    x = [point["start"].timestamp() for point in points]
+    y = [point["probability"] for point in points]
+    return [points[i] for i in lttb(x, y, max_points)]
+
+def _as_datetime(day):
+    return datetime(day.year, day.month, day.day)
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def _merge_weeks(points, extra_sums=()):
+    """Combine daily points (sorted by day) into ISO-week points."""
+    weeks = []
+    for point in points:
+        start = _as_datetime(_week_start(point["start"].date()))
+        if weeks and weeks[-1]["start"] == start:
+            week = weeks[-1]
+            week["probability_sum"] += point["probability_sum"]
+            week["count"] += point["count"]
+            week["min_probability"] = min(week["min_probability"], point["min_probability"])
+            week["max_probability"] = max(week["max_probability"], point["max_probability"])
+            for key in extra_sums:
+                week[key] = week[key] + point[key] if not isinstance(week[key], dict) else {
+                    level: week[key][level] + point[key][level] for level in week[key]
+                }
+            if "risk_level" in point:
+                week["risk_level"] = point["risk_level"]
+        else:
+            weeks.append({**point, "start": start})
+    for week in weeks:
+        week["probability"] = week["probability_sum"] / week["count"]
+    return weeks
+
+def _day_range(start, end):
+    """[first, stop) of the whole days inside [start, end); either may be None (open)."""
+    first = None
+    if start is not None:
+        first = start.date() if start == _as_datetime(start.date()) else start.date() + timedelta(days=1)
+    return first, None if end is None else end.date()
+
+def _edge_windows(start, end):
+    """Parts of [start, end) not covered by whole days, read from raw predictions.
+
+    This keeps day and week points on exactly the predictions raw mode returns
+    for the same `start` and `end`.
+    """
+    first, stop = _day_range(start, end)
+    if first is not None and stop is not None and first > stop:
+        return [(start, end)]  # Both ends fall within the same day
+    windows = []
+    if first is not None and _as_datetime(first) != start:
+        windows.append((start, _as_datetime(first)))
+    if stop is not None and _as_datetime(stop) != end:
+        windows.append((_as_datetime(stop), end))
+    return windows
+
+def _edge_groups(db: Session, start, end, student_ids=None):
+    """Per (student, day) aggregates, as in the rollup, of the edge windows."""
+    rows = []
+    for low, high in _edge_windows(start, end):
+        query = select(*_PREDICTION_COLUMNS).where(models.Prediction.timestamp >= low, models.Prediction.timestamp < high)
+        if student_ids is not None:
+            query = query.where(models.Prediction.student_id.in_(student_ids))
+        rows.extend(db.execute(query))
+    return _aggregate(rows)
+
+def _rollup_days(query, rollup, start, end):
+    first, stop = _day_range(start, end)
+    if first is not None:
+        query = query.where(rollup.day >= first)
+    if stop is not None:
+        query = query.where(rollup.day < stop)
+    return query
+
+def student_history(db: Session, student_id, bucket="day", start=None, end=None, max_points=500):
+    """Points of one student's risk trajectory, oldest first."""
+    if bucket == "raw":
+        query = select(models.Prediction.timestamp, models.Prediction.probability, models.Prediction.risk_level).where(
+            models.Prediction.student_id == student_id
+        )
+        if start is not None:
+            query = query.where(models.Prediction.timestamp >= start)
+        if end is not None:
+            query = query.where(models.Prediction.timestamp < end)
+        points = [
+            {"start": timestamp, "probability": probability, "min_probability": probability,
+             "max_probability": probability, "count": 1, "risk_level": risk_level}
+            for timestamp, probability, risk_level in db.execute(query.order_by(models.Prediction.timestamp))
+        ]
+        return _downsample(points, max_points)
+
+    rollup = models.DailyRiskRollup
+    query = select(
+        rollup.day, rollup.count, rollup.probability_sum, rollup.probability_min, rollup.probability_max,
+        rollup.last_risk_level,
+    ).where(rollup.student_id == student_id)
+    days = list(db.execute(_rollup_days(query, rollup, start, end)))
+    days += [
+        (day, count, total, low, high, level)
+        for (_, day), (count, total, low, high, _, level, _) in _edge_groups(db, start, end, [student_id]).items()
+    ]
+    points = [
+        {"start": _as_datetime(day), "probability": total / count, "probability_sum": total,
+         "min_probability": low, "max_probability": high, "count": count, "risk_level": level}
+        for day, count, total, low, high, level in sorted(days, key=lambda row: row[0])
+    ]
+    if bucket == "week":
+        points = _merge_weeks(points)
+    return _downsample(points, max_points)
+
+def cohort_history(db: Session, bucket="day", start=None, end=None, student_ids=None, max_points=500):
+    """Risk across many students per day or week, aggregated in one query over the rollup.
+
+    `student_days` counts (student, day) pairs with a prediction, so a student
+    scored on several days of a week counts once per day; `risk_counts` splits
+    those student-days by the student's last risk level of the day.
+    """
+    rollup = models.DailyRiskRollup
+    query = select(
+        rollup.day,
+        func.sum(rollup.count),
+        func.sum(rollup.probability_sum),
+        func.min(rollup.probability_min),
+        func.max(rollup.probability_max),
+        func.count(),
+        *(func.sum(case((rollup.last_risk_level == level, 1), else_=0)) for level in RISK_LEVELS),
+    )
+    query = _rollup_days(query, rollup, start, end)
+    if student_ids is not None:
+        query = query.where(rollup.student_id.in_(student_ids))
+    days = {
+        day: [count, total, low, high, student_days, *(int(v or 0) for v in level_counts)]
+        for day, count, total, low, high, student_days, *level_counts
+        in db.execute(query.group_by(rollup.day))
+    }
+    # Edge days are outside the rollup range, so they never collide with its days
+    for (_, day), (count, total, low, high, _, level, _) in _edge_groups(db, start, end, student_ids).items():
+        point = days.setdefault(day, [0, 0.0, low, high, 0] + [0] * len(RISK_LEVELS))
+        point[0] += count
+        point[1] += total
+        point[2] = min(point[2], low)
+        point[3] = max(point[3], high)
+        point[4] += 1
+        if level in RISK_LEVELS:
+            point[5 + RISK_LEVELS.index(level)] += 1
+    points = [
+        {"start": _as_datetime(day), "probability": total / count, "probability_sum": total,
+         "min_probability": low, "max_probability": high, "count": count, "student_days": student_days,
+         "risk_counts": dict(zip(RISK_LEVELS, level_counts))}
+        for day, (count, total, low, high, student_days, *level_counts) in sorted(days.items())
+    ]
+    if bucket == "week":
+        points = _merge_weeks(points, extra_sums=("student_days", "risk_counts"))
+    return _downsample(points, max_points)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the daily risk rollup.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute from every stored prediction")
+    args = parser.parse_args()
+    db = database.SessionLocal()
+    try:
+        folded = rebuild_rollups(db) if args.rebuild else refresh_rollups(db)
+    finally:
+        db.close()
+    print(f"Folded {folded} predictions into {ROLLUP_NAME}")
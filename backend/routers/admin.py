@@ -0,0 +1,69 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+import schemas, database, drift, hashing, instrumentation, ml_service, model_registry
+from routers.auth import get_current_user, auth_cache_stats
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_current_user)]
+)
+
+def _model_info():
+    bundle = ml_service.get_bundle()
+    return {
+        "version": bundle.version,
+        "path": bundle.path,
+        "format": bundle.format,
+        "loaded_at": bundle.loaded_at,
+        "active_version": model_registry.current_version(),
+        "available_versions": model_registry.list_versions(),
+        "reload": ml_service.reload_status(),
+    }
+
+@router.get("/model", response_model=schemas.ModelInfo)
+def read_model_info():
+    return _model_info()
+
+@router.post("/model/reload", response_model=schemas.ModelInfo, status_code=202)
+def reload_model(version: Optional[str] = None):
+    """Load (and optionally activate) a registry version in the background.
+
+    The current model keeps serving until the new one is loaded and warmed.
+    """
+    if version is not None and version not in model_registry.list_versions():
+        raise HTTPException(status_code=404, detail="Model version not found")
+    if not ml_service.reload_model_async(version):
+        raise HTTPException(status_code=409, detail="A model reload is already in progress")
+    return _model_info()
+
+@router.get("/drift", response_model=schemas.DriftReport)
+def read_drift(days: int = 7, db: Session = Depends(database.get_db)):
+    """Scored features of the last `days` days compared with the served model's training data.
+
+    `status` is the worst feature status; `alert` means PSI or the KS distance
+    crossed its alert threshold.
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be positive")
+    # Include what this process has counted but not flushed yet
+    drift.monitor.flush(db)
+    return drift.report(db, ml_service.get_bundle(), days)
+
+@router.get("/auth/cache", response_model=schemas.AuthCacheStats)
+def read_auth_cache_stats():
+    return auth_cache_stats()
+
+@router.get("/auth/hashing", response_model=schemas.HashingStats)
+def read_hashing_stats():
+    return hashing.pool.stats()
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def read_profile(profile_id: str):
+    """Collapsed-stack dump of a profiled request (`X-Profile: <secret>`)."""
+    profile = instrumentation.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
@@ -1,11 +1,17 @@
 from datetime import timedelta, datetime
 from typing import Optional
+import hashlib
+import os
+import time
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-import schemas, models, database
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import schemas, models, database, hashing
+from cache import LRUCache
+from instrumentation import stage
 
 router = APIRouter(
     prefix="/auth",
@@ -20,12 +26,40 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
+# Verified tokens (sha256 of the token -> username), each kept until the token expires
+_token_cache = LRUCache(maxsize=int(os.getenv("EARLYWARN_TOKEN_CACHE_SIZE", "10000")))
+# Detached user records by username; invalidate_user() drops an entry when the user changes
+_user_cache = LRUCache(
+    maxsize=int(os.getenv("EARLYWARN_USER_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("EARLYWARN_USER_CACHE_TTL", "300")),
+)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _overloaded():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent logins, retry shortly",
+        headers={"Retry-After": str(hashing.RETRY_AFTER_SECONDS)},
+    )
+
+async def verify_password_async(plain_password, hashed_password):
+    """`verify_password` on the bounded hashing pool; 503 when it is saturated."""
+    try:
+        return await hashing.pool.run(verify_password, plain_password, hashed_password)
+    except hashing.HashingOverloaded:
+        raise _overloaded()
+
+async def get_password_hash_async(password):
+    try:
+        return await hashing.pool.run(get_password_hash, password)
+    except hashing.HashingOverloaded:
+        raise _overloaded()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -36,16 +70,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    # DEMO MODE: If no token, return a mock user
-    if not token:
-        return models.User(id=1, username="demo_admin", hashed_password="mock_hash")
+def _token_key(token):
+    # Never keep raw bearer tokens in memory longer than the request
+    return hashlib.sha256(token.encode()).hexdigest()
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def _decode_token(token, credentials_exception):
+    """Username of a valid token, verifying the signature only on a cache miss."""
+    key = _token_key(token)
+    username = _token_cache.get(key)
+    if username is not None:
+        return username
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -54,15 +88,58 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+    # Tokens without an expiry are verified on every request
+    expires_at = payload.get("exp")
+    if expires_at is not None:
+        remaining = expires_at - time.time()
+        if remaining > 0:
+            _token_cache.set(key, token_data.username, ttl=remaining)
+    return token_data.username
+
+async def _load_user(username):
+    user = _user_cache.get(username)
+    if user is not None:
+        return user
+    async with database.AsyncSessionLocal() as db:
+        db_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if db_user is None:
+        return None
+    # A transient copy is safe to share between requests and threads
+    user = models.User(id=db_user.id, username=db_user.username, hashed_password=db_user.hashed_password)
+    _user_cache.set(username, user)
+    return user
+
+def invalidate_user(username):
+    """Drop a cached user record; call whenever a user is changed or deleted."""
+    _user_cache.pop(username)
+
+def auth_cache_stats():
+    return {"tokens": _token_cache.stats(), "users": _user_cache.stats()}
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # DEMO MODE: If no token, return a mock user
+    if not token:
+        return models.User(id=1, username="demo_admin", hashed_password="mock_hash")
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    # A session is only opened when the user is not cached
+    with stage("auth.verify_token"):
+        username = _decode_token(token, credentials_exception)
+    with stage("auth.load_user"):
+        user = await _load_user(username)
     if user is None:
         raise credentials_exception
     return user
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    # bcrypt must not run on the event loop
+    user = await _load_user(form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -75,13 +152,13 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/users", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    invalidate_user(db_user.username)
     return db_user
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import schemas, models, database, ml_service
+import hashlib
+import os
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+import schemas, models, database, drift, ml_service, scoring, jobs, risk_history
+import contributions as contributions_store
+from instrumentation import stage
 from routers.auth import get_current_user
-import json
 import random
 
 router = APIRouter(
@@ -12,37 +19,118 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.Prediction)
-def predict_risk(student_id: int, db: Session = Depends(database.get_db)):
+async def predict_risk(
+    student_id: int,
+    background_tasks: BackgroundTasks,
+    force: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
+):
     # 1. Fetch student data
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
+    with stage("predict.student_lookup"):
+        student = await db.get(models.Student, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    # 2. Get Prediction from Service
-    risk_level, probability, contributions = ml_service.predict_risk(
-        student.gpa, 
-        student.attendance_rate, 
-        student.assignments_completed,
-        student.household_income_bracket,
-        student.parent_education_level
-    )
-    
-    # 3. Store Prediction
+    # 2. Reuse the latest prediction if neither the features nor the model changed
+    bundle = ml_service.get_bundle()
+    fingerprint = models.feature_fingerprint(*(getattr(student, field) for field in models.FEATURE_FIELDS))
+    if not force and not isinstance(bundle, ml_service.MockBundle):
+        with stage("predict.latest_lookup"):
+            latest = await db.get(models.LatestPrediction, student.id)
+            if latest is not None and latest.model_version == bundle.version and latest.feature_fingerprint == fingerprint:
+                existing = await db.get(models.Prediction, latest.prediction_id)
+                if existing is not None:
+                    await db.run_sync(contributions_store.resolve, [existing.feature_schema_id])
+                    return existing
+
+    # 3. Get Prediction from Service (inference and the explanation are CPU-bound,
+    # so they run on the threadpool instead of stalling the event loop)
+    with stage("predict.model"):
+        risk_level, probability, contributions = await run_in_threadpool(
+            bundle.predict_risk,
+            student.gpa,
+            student.attendance_rate,
+            student.assignments_completed,
+            student.household_income_bracket,
+            student.parent_education_level,
+        )
+
+    # 4. Store Prediction
+    with stage("predict.pack_contributions"):
+        names = tuple(contributions)
+        schema_id = contributions_store.cached_schema_id(names)
+        if schema_id is None:
+            schema_id = await run_in_threadpool(contributions_store.schema_id, names)
+        packed = contributions_store.pack(list(contributions.values()))
     db_prediction = models.Prediction(
         student_id=student.id,
         risk_level=risk_level,
         probability=probability,
-        feature_contributions=json.dumps(contributions)
+        model_version=bundle.version,
+        contributions_packed=packed,
+        feature_schema_id=schema_id,
     )
-    db.add(db_prediction)
-    db.commit()
-    db.refresh(db_prediction)
+    with stage("predict.commit"):
+        db.add(db_prediction)
+        await db.flush()
+        await db.run_sync(scoring.record_latest, [{
+            "student_id": student.id,
+            "prediction_id": db_prediction.id,
+            "risk_level": risk_level,
+            "probability": probability,
+            "timestamp": db_prediction.timestamp,
+            "model_version": bundle.version,
+            "feature_fingerprint": fingerprint,
+        }])
+        await db.commit()
+    drift.monitor.observe(bundle, (
+        student.gpa,
+        student.attendance_rate,
+        student.assignments_completed,
+        student.household_income_bracket,
+        student.parent_education_level,
+    ))
+    # Fold it into the daily rollup after the response is sent
+    background_tasks.add_task(risk_history.refresh_pending)
     
     return db_prediction
 
+# Cohort scoring is CPU-bound, so it stays a sync handler on the threadpool
+@router.post("/batch", response_model=schemas.BatchPredictResponse)
+def predict_risk_batch(request: schemas.BatchPredictRequest, db: Session = Depends(database.get_db)):
+    if request.all_students == (request.student_ids is not None):
+        raise HTTPException(status_code=400, detail="Provide either student_ids or all_students=true")
+    if not 1 <= request.chunk_size <= scoring.MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between 1 and {scoring.MAX_CHUNK_SIZE}")
+
+    student_ids = None if request.all_students else request.student_ids
+    return scoring.score_students(db, student_ids=student_ids, chunk_size=request.chunk_size, force=request.force)
+
+@router.post("/jobs", response_model=schemas.ScoringJob, status_code=202)
+async def create_scoring_job(request: schemas.ScoringJobCreate, db: AsyncSession = Depends(database.get_async_db)):
+    if request.shard_size < 1 or request.chunk_size < 1:
+        raise HTTPException(status_code=400, detail="shard_size and chunk_size must be positive")
+    if request.chunk_size > scoring.MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be at most {scoring.MAX_CHUNK_SIZE}")
+    return await db.run_sync(
+        jobs.create_job, shard_size=request.shard_size, chunk_size=request.chunk_size, force=request.force
+    )
+
+@router.get("/jobs/{job_id}", response_model=schemas.ScoringJob)
+async def read_scoring_job(job_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    job = await db.scalar(
+        select(models.ScoringJob)
+        .options(selectinload(models.ScoringJob.shards))
+        .where(models.ScoringJob.id == job_id)
+    )
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @router.post("/simulate", response_model=schemas.SimulationResponse)
-def simulate_risk(request: schemas.SimulationRequest, db: Session = Depends(database.get_db)):
-    risk_level, probability, contributions = ml_service.predict_risk(
+async def simulate_risk(request: schemas.SimulationRequest):
+    risk_level, probability, contributions = await run_in_threadpool(
+        ml_service.predict_risk_cached,
         request.gpa,
         request.attendance_rate,
         request.assignments_completed,
@@ -56,19 +144,38 @@ def simulate_risk(request: schemas.SimulationRequest, db: Session = Depends(data
         feature_contributions=contributions
     )
 
+@router.get("/cache", response_model=schemas.CacheStats)
+def get_cache_stats():
+    return ml_service.cache_stats()
+
+METRICS_MAX_AGE = int(os.getenv("EARLYWARN_METRICS_MAX_AGE", "60"))
+_metrics_body = (None, None, None)  # (bundle, encoded JSON, ETag)
+
+def _encoded_metrics(bundle):
+    """The served model's metrics, validated and encoded once per bundle."""
+    global _metrics_body
+    cached_bundle, body, etag = _metrics_body
+    if cached_bundle is not bundle:
+        metrics = {"model_version": bundle.version, **bundle.metrics}
+        body = schemas.MetricsResponse(**metrics).model_dump_json().encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        _metrics_body = (bundle, body, etag)
+    return body, etag
+
+def _etag_matches(header, etag):
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
 @router.get("/metrics", response_model=schemas.MetricsResponse)
-def get_model_metrics():
-    import os
-    metrics_path = os.path.join(os.path.dirname(__file__), "../metrics.json")
-    if os.path.exists(metrics_path):
-        with open(metrics_path, "r") as f:
-            return json.load(f)
-    else:
-        # Return mock/default if not trained yet
-        return {
-            "accuracy": 0.0,
-            "precision": 0.0,
-            "recall": 0.0,
-            "f1_score": 0.0,
-            "last_trained": "Never"
-        }
+async def get_model_metrics(if_none_match: Optional[str] = Header(None)):
+    """Evaluation metrics of the served model version.
+
+    Loaded with the model, so this never touches the disk. Responses carry an
+    ETag; pollers sending it back in If-None-Match get a 304 until the model
+    changes.
+    """
+    body, etag = _encoded_metrics(ml_service.get_bundle())
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={METRICS_MAX_AGE}"}
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
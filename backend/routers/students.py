@@ -1,7 +1,17 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import schemas, models, database
+import schemas, models, database, ingest, risk_history
+import contributions as contributions_store
 from routers.auth import get_current_user
 
 router = APIRouter(
@@ -11,7 +21,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.Student)
-def create_student(student: schemas.StudentCreate, db: Session = Depends(database.get_db)):
+async def create_student(student: schemas.StudentCreate, db: AsyncSession = Depends(database.get_async_db)):
     db_student = models.Student(
         student_id=student.student_id,
         name=student.name,
@@ -22,18 +32,227 @@ def create_student(student: schemas.StudentCreate, db: Session = Depends(databas
         parent_education_level=student.parent_education_level
     )
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    await db.commit()
     return db_student
 
+# Bulk import parses and validates whole files, so it stays a sync handler on
+# the threadpool instead of blocking the event loop
+@router.post("/import", response_model=schemas.ImportSummary)
+def import_students(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    chunk_size: int = ingest.DEFAULT_CHUNK_SIZE,
+    db: Session = Depends(database.get_db),
+):
+    fmt = format or ingest.detect_format(file.filename)
+    if fmt not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'parquet'")
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    try:
+        return ingest.import_students(db, file.file, fmt, chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+EXPORT_COLUMNS = ["id"] + ingest.STUDENT_FIELDS
+EXPORT_BATCH_SIZE = 1000
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["after"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _row_dicts(columns, rows):
+    """Plain dicts from selected columns.
+
+    List endpoints select plain columns instead of loading ORM objects; the
+    response_model validates and encodes the dicts in one pass.
+    """
+    return [dict(zip(columns, row)) for row in rows]
+
 @router.get("/", response_model=List[schemas.Student])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    students = db.query(models.Student).offset(skip).limit(limit).all()
-    return students
+async def read_students(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """List students ordered by id.
+
+    Pages are keyset-paginated: when more rows may follow, the opaque cursor for
+    the next page is returned in the `X-Next-Cursor` header. `skip` is kept for
+    older clients and falls back to OFFSET.
+    """
+    if skip and cursor:
+        raise HTTPException(status_code=400, detail="Use either skip or cursor, not both")
+
+    query = select(*(getattr(models.Student, name) for name in EXPORT_COLUMNS)).order_by(models.Student.id)
+    if cursor:
+        query = query.where(models.Student.id > _decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+    rows = (await db.execute(query.limit(limit))).all()
+
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1][0])
+    return _row_dicts(EXPORT_COLUMNS, rows)
+
+def _stream_students(fmt):
+    # The request-scoped session may be closed before streaming finishes, so the
+    # generator owns its own session and reads through a server-side cursor.
+    db = database.SessionLocal()
+    try:
+        columns = [getattr(models.Student, name) for name in EXPORT_COLUMNS]
+        result = db.execute(
+            select(*columns).order_by(models.Student.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for rows in result.partitions():
+                yield b"".join(orjson.dumps(dict(zip(EXPORT_COLUMNS, row))) + b"\n" for row in rows)
+    finally:
+        db.close()
+
+@router.get("/export")
+def export_students(format: str = "ndjson"):
+    """Stream every student as NDJSON or CSV without loading the table into memory."""
+    if format == "csv":
+        return StreamingResponse(
+            _stream_students("csv"),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=students.csv"},
+        )
+    if format == "ndjson":
+        return StreamingResponse(_stream_students("ndjson"), media_type="application/x-ndjson")
+    raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+AT_RISK_COLUMNS = EXPORT_COLUMNS + ["risk_level", "probability", "predicted_at"]
+
+@router.get("/at-risk", response_model=List[schemas.AtRiskStudent])
+async def read_at_risk_students(
+    level: str = "High",
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """Students whose latest prediction is at `level`, highest probability first."""
+    if level not in ("Low", "Medium", "High"):
+        raise HTTPException(status_code=400, detail="level must be one of Low, Medium, High")
+    rows = (await db.execute(
+        select(
+            *(getattr(models.Student, name) for name in EXPORT_COLUMNS),
+            models.LatestPrediction.risk_level,
+            models.LatestPrediction.probability,
+            models.LatestPrediction.timestamp,
+        )
+        .join(models.LatestPrediction, models.LatestPrediction.student_id == models.Student.id)
+        .where(models.LatestPrediction.risk_level == level)
+        .order_by(models.LatestPrediction.probability.desc(), models.Student.id)
+        .offset(skip)
+        .limit(limit)
+    )).all()
+    return _row_dicts(AT_RISK_COLUMNS, rows)
+
+def _check_history_params(bucket, max_points, start, end):
+    if bucket not in risk_history.BUCKETS:
+        raise HTTPException(status_code=400, detail="bucket must be one of raw, day, week")
+    if max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be at least 3")
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+@router.get("/risk-history", response_model=schemas.CohortRiskHistory)
+async def read_cohort_risk_history(
+    bucket: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    student_ids: Optional[List[int]] = Query(None),
+    max_points: int = 500,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """Risk across all students (or `student_ids`) per day or week."""
+    if bucket == "raw":
+        raise HTTPException(status_code=400, detail="bucket must be day or week for cohorts")
+    _check_history_params(bucket, max_points, start, end)
+    points = await db.run_sync(
+        lambda session: risk_history.cohort_history(session, bucket, start, end, student_ids, max_points)
+    )
+    return {"bucket": bucket, "points": points}
 
 @router.get("/{student_id}", response_model=schemas.Student)
-def read_student(student_id: int, db: Session = Depends(database.get_db)):
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
+async def read_student(student_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    student = await db.get(models.Student, student_id)
     if student is None:
         raise HTTPException(status_code=404, detail="Student not found")
     return student
+
+@router.get("/{student_id}/predictions", response_model=List[schemas.Prediction])
+async def read_student_predictions(student_id: int, limit: int = 20, db: AsyncSession = Depends(database.get_async_db)):
+    """The student's most recent predictions, newest first, with structured contributions."""
+    if await db.get(models.Student, student_id) is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    rows = (await db.execute(
+        select(
+            models.Prediction.id,
+            models.Prediction.timestamp,
+            models.Prediction.risk_level,
+            models.Prediction.probability,
+            models.Prediction.model_version,
+            models.Prediction.contributions_packed,
+            models.Prediction.feature_schema_id,
+            models.Prediction.feature_contributions_json,
+        )
+        .where(models.Prediction.student_id == student_id)
+        .order_by(models.Prediction.timestamp.desc(), models.Prediction.id.desc())
+        .limit(limit)
+    )).all()
+    await db.run_sync(contributions_store.resolve, {row.feature_schema_id for row in rows})
+    return [
+        {
+            "id": prediction_id,
+            "timestamp": timestamp,
+            "risk_level": risk_level,
+            "probability": probability,
+            "model_version": model_version,
+            "feature_contributions": contributions_store.decode(packed, schema_id, legacy_json),
+        }
+        for prediction_id, timestamp, risk_level, probability, model_version, packed, schema_id, legacy_json in rows
+    ]
+
+@router.get("/{student_id}/risk-history", response_model=schemas.RiskHistory)
+async def read_student_risk_history(
+    student_id: int,
+    bucket: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_points: int = 500,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    """The student's risk trajectory, oldest first, downsampled to at most `max_points`.
+
+    `bucket` is `day` or `week` (aggregated from the daily rollup) or `raw`
+    (every prediction).
+    """
+    _check_history_params(bucket, max_points, start, end)
+    if await db.get(models.Student, student_id) is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    points = await db.run_sync(
+        lambda session: risk_history.student_history(session, student_id, bucket, start, end, max_points)
+    )
+    return {"student_id": student_id, "bucket": bucket, "points": points}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # Student Schemas
@@ -20,11 +20,29 @@ class Student(StudentBase):
     class Config:
         orm_mode = True
 
+class AtRiskStudent(Student):
+    risk_level: str
+    probability: float
+    predicted_at: datetime
+
+class ImportReject(BaseModel):
+    row: int
+    student_id: Optional[str] = None
+    errors: List[str]
+
+class ImportSummary(BaseModel):
+    received: int
+    upserted: int
+    rejected: int
+    rejects: List[ImportReject]
+    seconds: float
+    rows_per_second: float
+
 # Prediction Schemas
 class PredictionBase(BaseModel):
     risk_level: str
     probability: float
-    feature_contributions: str
+    feature_contributions: Dict[str, float] = {}
 
 class PredictionCreate(PredictionBase):
     student_id: int
@@ -32,9 +50,37 @@ class PredictionCreate(PredictionBase):
 class Prediction(PredictionBase):
     id: int
     timestamp: datetime
+    model_version: Optional[str] = None
     class Config:
         orm_mode = True
 
+# Risk History Schemas
+class RiskHistoryPoint(BaseModel):
+    start: datetime
+    probability: float  # Mean over the bucket
+    min_probability: float
+    max_probability: float
+    count: int
+    risk_level: Optional[str] = None  # Latest in the bucket
+
+class RiskHistory(BaseModel):
+    student_id: int
+    bucket: str
+    points: List[RiskHistoryPoint]
+
+class CohortRiskPoint(BaseModel):
+    start: datetime
+    probability: float
+    min_probability: float
+    max_probability: float
+    count: int
+    student_days: int  # Distinct (student, day) pairs, not distinct students
+    risk_counts: Dict[str, int]
+
+class CohortRiskHistory(BaseModel):
+    bucket: str
+    points: List[CohortRiskPoint]
+
 # User / Auth Schemas
 class UserBase(BaseModel):
     username: str
@@ -66,9 +112,178 @@ class SimulationResponse(BaseModel):
     probability: float
     feature_contributions: dict
 
+class BatchPredictRequest(BaseModel):
+    student_ids: Optional[List[int]] = None
+    all_students: bool = False
+    chunk_size: int = 5000
+    force: bool = False  # Rescore students whose features and model are unchanged
+
+class BatchChunkTiming(BaseModel):
+    rows: int
+    load_ms: float
+    score_ms: float
+    insert_ms: float
+
+class BatchPredictResponse(BaseModel):
+    scored: int
+    skipped: int
+    model_version: str
+    missing: List[int]
+    risk_counts: Dict[str, int]
+    chunks: List[BatchChunkTiming]
+    commit_ms: float
+    total_seconds: float
+    rows_per_second: float
+
+class ScoringJobCreate(BaseModel):
+    shard_size: int = 5000
+    chunk_size: int = 5000
+    force: bool = False
+
+class ScoringJobShard(BaseModel):
+    id: int
+    start_id: int
+    end_id: int
+    status: str
+    scored: int
+    skipped: Optional[int] = 0
+    high_risk: int
+    medium_risk: int
+    low_risk: int
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+    class Config:
+        orm_mode = True
+
+class ScoringJob(BaseModel):
+    id: int
+    status: str
+    shard_size: int
+    shard_count: int
+    completed_shards: int
+    failed_shards: int
+    total_students: int
+    scored: int
+    skipped: Optional[int] = 0
+    progress: float
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    shards: List[ScoringJobShard] = []
+    class Config:
+        orm_mode = True
+
+class LRUCacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: Optional[float] = None
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+class CacheStats(LRUCacheStats):
+    model_version: str
+
+class AuthCacheStats(BaseModel):
+    tokens: LRUCacheStats
+    users: LRUCacheStats
+
+class HashingStats(BaseModel):
+    workers: int
+    max_pending: int
+    pending: int
+    queued: int
+    running: int
+    submitted: int
+    completed: int
+    rejected: int
+    max_pending_seen: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    avg_run_ms: float
+
+class ModelReloadStatus(BaseModel):
+    state: str
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ModelInfo(BaseModel):
+    version: str
+    path: Optional[str] = None
+    format: Optional[str] = None  # "flat" (memory-mapped) or "pickle"
+    loaded_at: Optional[datetime] = None
+    active_version: Optional[str] = None
+    available_versions: List[str]
+    reload: ModelReloadStatus
+
+class DriftThresholds(BaseModel):
+    psi_warn: float
+    psi_alert: float
+    ks_alert: float
+    min_samples: int
+
+class FeatureDrift(BaseModel):
+    n: int
+    psi: float
+    ks: float
+    status: str
+    edges: List[float]
+    reference: List[float]  # Bin proportions at training time
+    current: List[float]    # Bin proportions over the window
+
+class DriftReport(BaseModel):
+    model_version: Optional[str] = None
+    window_days: int
+    status: str  # ok | warn | alert | insufficient_data | no_reference
+    n: int
+    thresholds: DriftThresholds
+    features: Dict[str, FeatureDrift]
+
+class ConfusionMatrix(BaseModel):
+    tn: int
+    fp: int
+    fn: int
+    tp: int
+
+class ClassMetrics(BaseModel):
+    precision: float
+    recall: float
+    f1_score: float
+    support: int
+
+class CalibrationBin(BaseModel):
+    bin_start: float
+    bin_end: float
+    count: int
+    mean_predicted: Optional[float] = None
+    observed_rate: Optional[float] = None
+
+class GroupMetrics(BaseModel):
+    count: int
+    accuracy: float
+    precision: float
+    recall: float
+    f1_score: float
+    roc_auc: Optional[float] = None
+    positive_rate: float
+    predicted_positive_rate: float
+
 class MetricsResponse(BaseModel):
     accuracy: float
     precision: float
     recall: float
     f1_score: float
     last_trained: str
+    # Evaluation bundle written by training.py; absent for older models
+    model_version: Optional[str] = None
+    roc_auc: Optional[float] = None
+    n_test: Optional[int] = None
+    threshold: Optional[float] = None
+    brier_score: Optional[float] = None
+    confusion_matrix: Optional[ConfusionMatrix] = None
+    per_class: Optional[Dict[str, ClassMetrics]] = None
+    calibration: Optional[List[CalibrationBin]] = None
+    by_group: Optional[Dict[str, Dict[str, GroupMetrics]]] = None
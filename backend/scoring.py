@@ -0,0 +1,211 @@
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import exists, insert
+from sqlalchemy.orm import Session
+import contributions, database, drift, models, ml_service, risk_history
+
+DEFAULT_CHUNK_SIZE = 5000
+# Chunks bind their ids as SQL parameters, and SQLite caps those per statement
+MAX_CHUNK_SIZE = 10_000
+
+# Column order must match ml_service._feature_names
+FEATURE_COLUMNS = [
+    models.Student.gpa,
+    models.Student.attendance_rate,
+    models.Student.assignments_completed,
+    models.Student.household_income_bracket,
+    models.Student.parent_education_level,
+]
+
+def _is_unchanged(model_version):
+    """True for students whose latest prediction used these features and this model."""
+    return exists().where(
+        models.LatestPrediction.student_id == models.Student.id,
+        models.LatestPrediction.model_version == model_version,
+        models.LatestPrediction.feature_fingerprint == models.Student.feature_fingerprint,
+    )
+
+def unchanged_students(db: Session, model_version, student_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, min_id=None, max_id=None):
+    """Ids (for `student_ids`) or the count (for an id range) of students scoring would skip."""
+    base = db.query(models.Student.id).filter(_is_unchanged(model_version))
+    if student_ids is None:
+        if min_id is not None:
+            base = base.filter(models.Student.id >= min_id)
+        if max_id is not None:
+            base = base.filter(models.Student.id <= max_id)
+        return base.count()
+    ids = sorted(set(student_ids))
+    unchanged = set()
+    for start in range(0, len(ids), chunk_size):
+        unchanged.update(row[0] for row in base.filter(models.Student.id.in_(ids[start:start + chunk_size])))
+    return unchanged
+
+def iter_feature_chunks(db: Session, student_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, min_id=None, max_id=None,
+                        skip_unchanged_for=None):
+    """Yield (ids, features) arrays for students, `chunk_size` rows at a time.
+
+    With `student_ids=None` the table (optionally restricted to the inclusive
+    id range [min_id, max_id]) is walked by primary key (keyset), otherwise the
+    requested ids are loaded with one IN query per chunk. With a model version
+    in `skip_unchanged_for`, students already scored by it on their current
+    features are left out.
+    """
+    base = db.query(models.Student.id, *FEATURE_COLUMNS)
+    if skip_unchanged_for is not None:
+        base = base.filter(~_is_unchanged(skip_unchanged_for))
+
+    if student_ids is None:
+        if max_id is not None:
+            base = base.filter(models.Student.id <= max_id)
+        last_id = 0 if min_id is None else min_id - 1
+        while True:
+            rows = (
+                base.filter(models.Student.id > last_id)
+                .order_by(models.Student.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield _to_arrays(rows)
+    else:
+        ids = sorted(set(student_ids))
+        for start in range(0, len(ids), chunk_size):
+            rows = (
+                base.filter(models.Student.id.in_(ids[start:start + chunk_size]))
+                .order_by(models.Student.id)
+                .all()
+            )
+            if rows:
+                yield _to_arrays(rows)
+
+def _to_arrays(rows):
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1:]
+
+def record_latest(db: Session, predictions):
+    """Upsert rows into latest_predictions, keeping the newest per student.
+
+    Every code path that stores Prediction rows calls this in the same
+    transaction, so the table always mirrors the latest stored prediction.
+    """
+    if not predictions:
+        return
+    stmt = database.dialect_insert(db.get_bind())(models.LatestPrediction)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.LatestPrediction.student_id],
+        set_={
+            "prediction_id": stmt.excluded.prediction_id,
+            "risk_level": stmt.excluded.risk_level,
+            "probability": stmt.excluded.probability,
+            "timestamp": stmt.excluded.timestamp,
+            "model_version": stmt.excluded.model_version,
+            "feature_fingerprint": stmt.excluded.feature_fingerprint,
+        },
+        where=models.LatestPrediction.timestamp <= stmt.excluded.timestamp,
+    )
+    db.execute(stmt, predictions)
+
+def score_students(db: Session, student_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, min_id=None, max_id=None, force=False):
+    """Score a cohort and bulk-insert one Prediction per student.
+
+    Students whose latest prediction was made by the current model on their
+    current features are skipped (and counted) unless `force` is set.
+    All chunks are written in a single transaction that is committed at the end.
+    Returns a summary dict with per-chunk timings (milliseconds).
+    """
+    started = time.perf_counter()
+    chunks = []
+    risk_counts = {"Low": 0, "Medium": 0, "High": 0}
+    scored_ids = set()
+    drift_counts = None  # Binned locally until the commit succeeds
+
+    # One model version for the whole run, even if a reload happens meanwhile
+    bundle = ml_service.get_bundle()
+    schema_id = contributions.schema_id(bundle.contribution_names)
+    # Mock predictions are random, so they are never considered up to date
+    skip_for = None if force or isinstance(bundle, ml_service.MockBundle) else bundle.version
+    unchanged = set() if skip_for is None else unchanged_students(db, skip_for, student_ids, chunk_size, min_id, max_id)
+    chunk_iter = iter_feature_chunks(db, student_ids, chunk_size, min_id=min_id, max_id=max_id,
+                                     skip_unchanged_for=skip_for)
+    while True:
+        t0 = time.perf_counter()
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            break
+        ids, features = chunk
+
+        t1 = time.perf_counter()
+        risk_levels, probs, contribution_matrix = ml_service.predict_risk_batch(features, bundle, as_matrix=True)
+        if bundle.drift_reference is not None:
+            drift_counts = drift.bin_batch(bundle.drift_reference, features, drift_counts)
+
+        t2 = time.perf_counter()
+        timestamp = datetime.utcnow()
+        fingerprints = [models.feature_fingerprint(*row) for row in features.tolist()]
+        rows = [
+            {
+                "student_id": int(sid),
+                "risk_level": risk,
+                "probability": float(prob),
+                "timestamp": timestamp,
+                "model_version": bundle.version,
+                "contributions_packed": packed,
+                "feature_schema_id": schema_id,
+            }
+            for sid, risk, prob, packed in zip(ids, risk_levels, probs, contributions.pack_rows(contribution_matrix))
+        ]
+        inserted = db.execute(
+            insert(models.Prediction).returning(models.Prediction.student_id, models.Prediction.id),
+            rows,
+        )
+        prediction_ids = dict(inserted.all())
+        record_latest(db, [
+            {
+                "student_id": row["student_id"],
+                "prediction_id": prediction_ids[row["student_id"]],
+                "risk_level": row["risk_level"],
+                "probability": row["probability"],
+                "timestamp": timestamp,
+                "model_version": bundle.version,
+                "feature_fingerprint": fingerprint,
+            }
+            for row, fingerprint in zip(rows, fingerprints)
+        ])
+        t3 = time.perf_counter()
+
+        for risk in risk_levels:
+            risk_counts[risk] += 1
+        scored_ids.update(int(sid) for sid in ids)
+        chunks.append({
+            "rows": len(ids),
+            "load_ms": (t1 - t0) * 1000,
+            "score_ms": (t2 - t1) * 1000,
+            "insert_ms": (t3 - t2) * 1000,
+        })
+
+    t_commit = time.perf_counter()
+    db.commit()
+    # Only committed predictions count towards drift
+    if drift_counts is not None:
+        drift.monitor.add(bundle.version, bundle.drift_reference.names, drift_counts)
+    risk_history.refresh_pending()
+    commit_ms = (time.perf_counter() - t_commit) * 1000
+
+    total_seconds = time.perf_counter() - started
+    scored = len(scored_ids)
+    skipped = unchanged if isinstance(unchanged, int) else len(unchanged)
+    missing = [] if student_ids is None else sorted(set(student_ids) - scored_ids - unchanged)
+    return {
+        "scored": scored,
+        "skipped": skipped,
+        "model_version": bundle.version,
+        "missing": missing,
+        "risk_counts": risk_counts,
+        "chunks": chunks,
+        "commit_ms": commit_ms,
+        "total_seconds": total_seconds,
+        "rows_per_second": scored / total_seconds if total_seconds > 0 else 0.0,
+    }
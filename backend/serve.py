@@ -0,0 +1,187 @@
+"""Production launcher: preload the app and model once, then fork workers that share them copy-on-write."""
+import argparse
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+WORKERS = os.getenv("EARLYWARN_WORKERS")
+RESTART_DELAY = 1.0
+
+def usable_cpus():
+    """CPUs this process may run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def memory_usage(pid="self"):
+    """RSS, PSS and shared memory of a process in MB, from /proc (empty elsewhere)."""
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb"}
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    usage[fields[key]] = usage.get(fields[key], 0.0) + int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+def _format_memory(usage):
+    if not usage:
+        return "memory n/a"
+    return f"RSS {usage['rss_mb']:.0f} MB, PSS {usage['pss_mb']:.0f} MB, shared {usage['shared_mb']:.0f} MB"
+
+def preload(migrate=True):
+    """Migrate, import the app and load the model in this (master) process."""
+    started = time.perf_counter()
+    if migrate:
+        import database, migrations
+        migrations.run(database.engine)
+    # Workers must not migrate again on startup
+    os.environ["EARLYWARN_AUTO_MIGRATE"] = "0"
+    from main import app
+    import database, ml_service
+
+    # Pooled connections must not be shared across fork
+    database.engine.dispose()
+    # Move everything loaded so far out of the collector's reach; collections in
+    # the workers would otherwise touch (and unshare) every tracked object
+    gc.collect()
+    gc.freeze()
+    return app, ml_service.get_bundle(), time.perf_counter() - started
+
+def bind(host, port, backlog=2048):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(app, sock, forked_at, ready_fd, log_level):
+    import uvicorn
+
+    async def report_ready():
+        usage = memory_usage()
+        message = {"pid": os.getpid(), "startup_ms": (time.monotonic() - forked_at) * 1000, **usage}
+        os.write(ready_fd, (json.dumps(message) + "\n").encode())
+        print(f"Worker {os.getpid()} ready in {message['startup_ms']:.0f} ms ({_format_memory(usage)})", flush=True)
+
+    app.router.on_startup.append(report_ready)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+class Master:
+    def __init__(self, app, sock, workers, log_level):
+        self.app = app
+        self.sock = sock
+        self.n_workers = workers
+        self.log_level = log_level
+        self.workers = {}  # pid -> fork time
+        self.stopping = False
+        self.ready_read, self.ready_write = os.pipe()
+        self._buffer = b""
+        self._reported = {}  # pid -> ready message of live workers
+
+    def spawn(self):
+        forked_at = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            # The master's handlers would signal the siblings; uvicorn installs its own
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                os.close(self.ready_read)
+                run_worker(self.app, self.sock, forked_at, self.ready_write, self.log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.workers[pid] = forked_at
+        return pid
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _read_ready(self):
+        self._buffer += os.read(self.ready_read, 65536)
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            message = json.loads(line)
+            self._reported[message["pid"]] = message
+        if len(self._reported) == self.n_workers:
+            reports = list(self._reported.values())
+            pss = sum(r.get("pss_mb", 0.0) for r in reports) + memory_usage().get("pss_mb", 0.0)
+            rss = sum(r.get("rss_mb", 0.0) for r in reports) + memory_usage().get("rss_mb", 0.0)
+            print(
+                f"{len(reports)} workers ready, slowest in {max(r['startup_ms'] for r in reports):.0f} ms; "
+                f"pool PSS {pss:.0f} MB (summed RSS {rss:.0f} MB)",
+                flush=True,
+            )
+
+    def _reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            self.workers.pop(pid, None)
+            self._reported.pop(pid, None)
+            if not self.stopping:
+                print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting", flush=True)
+                time.sleep(RESTART_DELAY)
+                self.spawn()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.n_workers):
+            self.spawn()
+        while self.workers:
+            readable, _, _ = select.select([self.ready_read], [], [], 0.5)
+            if readable:
+                self._read_ready()
+            self._reap()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API from preloaded, forked workers.")
+    parser.add_argument("--host", default=os.getenv("EARLYWARN_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("EARLYWARN_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(WORKERS) if WORKERS else None,
+                        help="Worker processes (default: one per usable CPU)")
+    parser.add_argument("--no-migrate", action="store_true", help="Skip the schema migration step")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    workers = usable_cpus() if args.workers is None else args.workers
+    if workers < 1:
+        parser.error("--workers must be positive")
+
+    app, bundle, seconds = preload(migrate=not args.no_migrate)
+    print(f"Preloaded app and model {bundle.version} ({bundle.format or 'mock'}) in {seconds:.2f}s "
+          f"({_format_memory(memory_usage())})", flush=True)
+    sock = bind(args.host, args.port)
+    print(f"Serving on {args.host}:{args.port} with {workers} workers", flush=True)
+    Master(app, sock, workers, args.log_level).run()
+
+if __name__ == "__main__":
+    main()
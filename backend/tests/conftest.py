@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+# The backend reads its configuration at import time, so point it at a
+# throwaway database and an empty model registry before anything imports it.
+_tmp = tempfile.mkdtemp(prefix="earlywarn-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["EARLYWARN_MODEL_REGISTRY"] = os.path.join(_tmp, "registry")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import database, migrations, models, training
+
+@pytest.fixture(scope="session")
+def model():
+    X, y = training.load(training.iter_synthetic(rows=600, seed=7))
+    clf = RandomForestClassifier(n_estimators=8, max_depth=5, random_state=0)
+    clf.fit(pd.DataFrame(X, columns=training.FEATURES), y)
+    return clf
+
+@pytest.fixture(scope="session")
+def model_path(model, tmp_path_factory):
+    path = tmp_path_factory.mktemp("model") / "model.pkl"
+    joblib.dump(model, path)
+    return str(path)
+
+@pytest.fixture(scope="session")
+def bundle(model_path):
+    import ml_service
+    return ml_service.ModelBundle("test", model_path)
+
+@pytest.fixture(scope="session")
+def schema():
+    migrations.run(database.engine)
+
+# Feature schemas stay: their ids are cached per process
+_TABLES = ("daily_risk_rollups", "rollup_state", "latest_predictions", "predictions", "feature_drift_counts", "students")
+
+@pytest.fixture
+def db(schema):
+    with database.engine.begin() as conn:
+        for name in _TABLES:
+            conn.execute(models.Base.metadata.tables[name].delete())
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
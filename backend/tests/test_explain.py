@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ml_service, training
+from explain import LeafBudgetExceeded, TreeExplainer
+from tree_engine import FlatForest
+
+def test_attributions_sum_to_probability(model):
+    forest = FlatForest.from_sklearn(model, feature_names=training.FEATURES)
+    explainer = TreeExplainer(forest)
+    X = ml_service._probe_features(200, seed=3)
+
+    phi = explainer.shap_values(X)
+    expected = model.predict_proba(pd.DataFrame(X, columns=training.FEATURES))[:, 1]
+
+    assert phi.shape == (len(X), len(training.FEATURES))
+    # Tables are float32, so allow for its rounding
+    np.testing.assert_allclose(phi.sum(axis=1) + explainer.expected_value, expected, atol=1e-5)
+
+def test_explain_names_every_feature(model):
+    explainer = TreeExplainer(FlatForest.from_sklearn(model, feature_names=training.FEATURES))
+    [row] = explainer.explain(ml_service._probe_features(1))
+    assert list(row) == training.FEATURES
+
+def test_forests_over_the_leaf_budget_are_not_tabulated(model):
+    forest = FlatForest.from_sklearn(model, feature_names=training.FEATURES)
+    n_leaves = int(forest.is_leaf.sum())
+    with pytest.raises(LeafBudgetExceeded):
+        TreeExplainer(forest, max_leaves=n_leaves - 1)
+    assert TreeExplainer(forest, max_leaves=n_leaves).n_leaves == n_leaves
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+from hashing import HashingOverloaded, HashingPool
+
+def test_cancelled_queued_hash_releases_its_slot():
+    pool = HashingPool(workers=1, max_pending=2)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "never"))
+        await asyncio.sleep(0.05)
+        queued.cancel()  # A client disconnecting while its login waits
+        await asyncio.sleep(0)
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+    pool._executor.shutdown(wait=True)  # Done callbacks run on the worker threads
+    stats = pool.stats()
+    assert (stats["pending"], stats["queued"], stats["running"]) == (0, 0, 0)
+    assert stats["completed"] == 1
+
+def test_submit_rejects_at_the_pending_ceiling():
+    pool = HashingPool(workers=1, max_pending=1)
+    release = threading.Event()
+    future = pool.submit(release.wait)
+    try:
+        pool.submit(lambda: None)
+    except HashingOverloaded:
+        pass
+    else:
+        raise AssertionError("expected HashingOverloaded")
+    release.set()
+    future.result()
+    pool._executor.shutdown(wait=True)
+    assert pool.stats()["pending"] == 0 and pool.stats()["rejected"] == 1
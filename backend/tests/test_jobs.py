@@ -0,0 +1,46 @@
+from sqlalchemy import delete
+
+import generate_data, jobs, models
+
+def test_shards_cover_existing_ids_across_gaps(db):
+    generate_data.write_db([generate_data.generate_chunk(1, 30, seed=0)], db)
+    db.execute(delete(models.Student).where(models.Student.id.between(5, 20)))
+    db.commit()
+
+    assert list(jobs.shard_ranges(db, 4)) == [(1, 4), (21, 24), (25, 28), (29, 30)]
+
+def test_unfinished_jobs_of_exited_owners_are_failed(db):
+    for table in (models.ScoringJobShard, models.ScoringJob):
+        db.execute(delete(table))
+    stale = models.ScoringJob(status="running", shard_count=2, owner=jobs._owner())
+    live = models.ScoringJob(status="running", shard_count=1, owner="elsewhere:1")
+    db.add_all([stale, live])
+    db.flush()
+    db.add_all([
+        models.ScoringJobShard(job_id=stale.id, start_id=1, end_id=2, status="completed"),
+        models.ScoringJobShard(job_id=stale.id, start_id=3, end_id=4, status="running"),
+        models.ScoringJobShard(job_id=live.id, start_id=1, end_id=4, status="running"),
+    ])
+    db.commit()
+
+    assert jobs.recover_stale_jobs(db) == [stale.id]
+    db.refresh(stale)
+    assert (stale.status, stale.completed_shards, stale.failed_shards) == ("failed", 2, 1)
+    assert stale.finished_at is not None
+    assert db.get(models.ScoringJob, live.id).status == "running"
+
+class _BrokenPool:
+    def submit(self, *args):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+def test_job_is_failed_when_its_shards_cannot_be_submitted(db, monkeypatch):
+    generate_data.write_db([generate_data.generate_chunk(1, 10, seed=0)], db)
+    monkeypatch.setattr(jobs, "get_executor", _BrokenPool)
+
+    job = jobs.create_job(db, shard_size=4)
+    assert (job.status, job.shard_count, job.completed_shards, job.failed_shards) == ("failed", 3, 3, 3)
+    assert job.finished_at is not None
+    assert all(shard.status == "failed" for shard in job.shards)
+
+def test_missing_shard_is_skipped(db):
+    assert jobs.run_shard(job_id=-1, shard_id=-1) is None
@@ -0,0 +1,41 @@
+import shutil
+import numpy as np
+import pytest
+
+import ml_service, model_format, training
+from explain import TreeExplainer
+from tree_engine import FlatForest
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip_predicts_identically(model, tmp_path, mmap):
+    path = model_format.export(model, str(tmp_path / "model.flat"), training.FEATURES, fingerprint="abc")
+    flat = model_format.load(path, mmap=mmap)
+
+    forest = FlatForest.from_sklearn(model, feature_names=training.FEATURES)
+    X = ml_service._probe_features(500, seed=1)
+    assert flat.fingerprint == "abc"
+    assert flat.forest.feature_names == training.FEATURES
+    np.testing.assert_array_equal(flat.forest.predict_proba(X), forest.predict_proba(X))
+    np.testing.assert_array_equal(flat.explainer.shap_values(X), TreeExplainer(forest).shap_values(X))
+
+def test_bundle_serves_the_flat_model(model_path, bundle, tmp_path):
+    copy = shutil.copy(model_path, tmp_path / "model.pkl")
+    model_format.export_file(str(copy))
+    flat_bundle = ml_service.ModelBundle("test", str(copy))
+
+    X = ml_service._probe_features(100, seed=2)
+    assert flat_bundle.format == "flat" and bundle.format == "pickle"
+    np.testing.assert_array_equal(flat_bundle.predict_risk_batch(X)[1], bundle.predict_risk_batch(X)[1])
+
+def test_explainer_table_is_optional(model, tmp_path):
+    path = model_format.export(model, str(tmp_path / "model.flat"), training.FEATURES, explainer=False)
+    assert not (tmp_path / "model.explain").exists()
+    assert model_format.load(path).explainer is None
+
+def test_table_from_another_model_is_ignored(model, tmp_path):
+    path = model_format.export(model, str(tmp_path / "model.flat"), training.FEATURES, fingerprint="abc")
+    assert model_format.load(path).explainer is not None
+    shutil.copy(tmp_path / "model.explain", tmp_path / "other.explain")
+    model_format.export(model, path, training.FEATURES, fingerprint="def", explainer=False)
+    shutil.copy(tmp_path / "other.explain", tmp_path / "model.explain")
+    assert model_format.load(path).explainer is None
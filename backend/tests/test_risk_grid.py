@@ -0,0 +1,12 @@
+import os
+
+import ml_service, model_registry, training
+
+def test_published_grid_is_found_beside_the_served_model(model, monkeypatch):
+    version = training.publish(model, {}, grid_step=0.1, activate=False)
+    model_path = os.path.join(model_registry.version_dir(version), model_registry.MODEL_FILE)
+    monkeypatch.setattr(ml_service, "GRID_MODE", "nearest")
+
+    bundle = ml_service.ModelBundle(version, model_path)
+    assert bundle.grid is not None
+    assert bundle.grid.model_version == bundle.fingerprint
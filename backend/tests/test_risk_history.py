@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sqlalchemy import func, insert, select
+
+import database, generate_data, models, risk_history
+
+class _NoLock:
+    """Stands in for the per-process lock so threads race like separate processes."""
+
+    def acquire(self, blocking=True):
+        return True
+
+    def release(self):
+        pass
+
+@pytest.fixture
+def predictions(db):
+    generate_data.write_db([generate_data.generate_chunk(1, 20, seed=0)], db)
+    started = datetime(2026, 3, 2)
+    rows = [
+        {
+            "student_id": 1 + i % 20,
+            "risk_level": "Medium",
+            "probability": (i % 100) / 100,
+            "timestamp": started + timedelta(hours=i),
+            "model_version": "test",
+        }
+        for i in range(500)
+    ]
+    db.execute(insert(models.Prediction), rows)
+    db.commit()
+    return rows
+
+def test_concurrent_refreshes_fold_each_prediction_once(db, predictions, monkeypatch):
+    monkeypatch.setattr(risk_history, "_refresh_lock", _NoLock())
+    errors = []
+
+    def refresh():
+        session = database.SessionLocal()
+        try:
+            risk_history.refresh_rollups(session, chunk_size=17)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Whatever a losing thread left behind is picked up by the next refresh
+    risk_history.refresh_rollups(db)
+
+    assert not errors
+    rollup = models.DailyRiskRollup
+    count, total = db.execute(select(func.sum(rollup.count), func.sum(rollup.probability_sum))).one()
+    assert count == len(predictions)
+    assert total == pytest.approx(sum(row["probability"] for row in predictions))
+
+def test_refresh_only_reads_new_predictions(db, predictions):
+    assert risk_history.refresh_rollups(db) == len(predictions)
+    assert risk_history.refresh_rollups(db) == 0
+
+def _prediction(prediction_id, student_id, timestamp, probability=0.5):
+    return {"id": prediction_id, "student_id": student_id, "risk_level": "Medium",
+            "probability": probability, "timestamp": timestamp, "model_version": "test"}
+
+def test_ids_committed_below_the_watermark_are_folded(db):
+    generate_data.write_db([generate_data.generate_chunk(1, 2, seed=0)], db)
+    day = datetime(2026, 3, 2)
+    # 6 and 7 are reserved by a transaction that commits after the refresh
+    db.execute(insert(models.Prediction), [_prediction(i, 1, day) for i in (1, 2, 3, 4, 5, 8, 9, 10)])
+    db.commit()
+    assert risk_history.refresh_rollups(db) == 8
+
+    db.execute(insert(models.Prediction), [_prediction(i, 2, day) for i in (6, 7)])
+    db.commit()
+    assert risk_history.refresh_rollups(db) == 2
+    assert risk_history.refresh_rollups(db) == 0
+
+    counts = dict(db.execute(select(models.DailyRiskRollup.student_id, models.DailyRiskRollup.count)).all())
+    assert counts == {1: 8, 2: 2}
+    assert db.get(models.RollupState, risk_history.ROLLUP_NAME).gaps is None
+
+def test_expired_gaps_are_dropped(db, monkeypatch):
+    generate_data.write_db([generate_data.generate_chunk(1, 1, seed=0)], db)
+    db.execute(insert(models.Prediction), [_prediction(i, 1, datetime(2026, 3, 2)) for i in (1, 5)])
+    db.commit()
+    risk_history.refresh_rollups(db)
+    assert db.get(models.RollupState, risk_history.ROLLUP_NAME).gaps is not None
+
+    monkeypatch.setattr(risk_history, "GAP_SECONDS", 0)
+    risk_history.refresh_rollups(db)
+    db.expire_all()
+    assert db.get(models.RollupState, risk_history.ROLLUP_NAME).gaps is None
+
+@pytest.mark.parametrize("start, end", [
+    (datetime(2026, 3, 2, 10, 30), datetime(2026, 3, 4, 5)),
+    (datetime(2026, 3, 3), datetime(2026, 3, 5)),
+    (datetime(2026, 3, 3, 2), datetime(2026, 3, 3, 20)),
+    (None, datetime(2026, 3, 3, 12)),
+])
+def test_rollup_buckets_cover_the_same_predictions_as_raw(db, predictions, start, end):
+    risk_history.refresh_rollups(db)
+    raw = risk_history.student_history(db, 1, "raw", start, end, max_points=None)
+    for bucket in ("day", "week"):
+        points = risk_history.student_history(db, 1, bucket, start, end, max_points=None)
+        assert sum(point["count"] for point in points) == len(raw)
+        cohort = risk_history.cohort_history(db, bucket, start, end, [1], max_points=None)
+        assert sum(point["count"] for point in cohort) == len(raw)
+
+def test_lttb_keeps_endpoints_and_n_out_points():
+    rng = np.random.default_rng(0)
+    x = np.arange(1000)
+    y = rng.normal(size=1000)
+    y[500] = 10.0  # A spike the downsampled series must keep
+
+    keep = risk_history.lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 500 in keep
+
+def test_lttb_returns_short_series_unchanged():
+    assert risk_history.lttb([0, 1, 2], [0.0, 1.0, 0.0], 10).tolist() == [0, 1, 2]
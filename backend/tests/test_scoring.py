@@ -0,0 +1,36 @@
+import pytest
+
+import generate_data, ml_service, models, scoring
+
+N_STUDENTS = 40
+
+@pytest.fixture
+def cohort(db, bundle, monkeypatch):
+    monkeypatch.setattr(ml_service, "_bundle", bundle)
+    generate_data.write_db([generate_data.generate_chunk(1, N_STUDENTS, seed=0)], db)
+    return db
+
+def test_rerun_with_unchanged_features_skips_everyone(cohort):
+    first = scoring.score_students(cohort)
+    second = scoring.score_students(cohort)
+
+    assert (first["scored"], first["skipped"]) == (N_STUDENTS, 0)
+    assert (second["scored"], second["skipped"]) == (0, N_STUDENTS)
+    assert cohort.query(models.Prediction).count() == N_STUDENTS
+
+def test_changed_student_is_the_only_one_rescored(cohort):
+    scoring.score_students(cohort)
+    # Through the ORM, so the fingerprint listener sees the change
+    student = cohort.query(models.Student).order_by(models.Student.id).first()
+    student.gpa = 1.0 if student.gpa > 2.0 else 3.5
+    cohort.commit()
+
+    rerun = scoring.score_students(cohort)
+    assert (rerun["scored"], rerun["skipped"]) == (1, N_STUDENTS - 1)
+    latest = cohort.get(models.LatestPrediction, student.id)
+    assert latest.feature_fingerprint == student.feature_fingerprint
+
+def test_force_rescores_everyone(cohort):
+    scoring.score_students(cohort)
+    forced = scoring.score_students(cohort, force=True)
+    assert (forced["scored"], forced["skipped"]) == (N_STUDENTS, 0)
@@ -0,0 +1,407 @@
+"""Train, evaluate and publish the at-risk model.
+
+One pipeline for every data source:
+
+    python training.py --source db                           # labeled rows of the students table
+    python training.py --source csv --path students.csv      # at_risk or risk_level column
+    python training.py --source parquet --path students.parquet
+    python training.py --source synthetic --rows 1000000
+
+Rows are streamed in chunks into compact arrays (float32 features, int8
+brackets and labels, ~21 bytes per row). Cross-validation folds for every
+hyperparameter candidate run in parallel on a process pool that reads the
+training arrays through a shared memory map. The best candidate is refit on all
+cores, evaluated on a holdout split and published to the model registry
+atomically, together with its metrics, drift reference and risk grid.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+import drift, explain, ingest, model_format, model_registry
+from risk_grid import accuracy_report, build_grid, model_fingerprint, save_grid
+from tree_engine import FlatForest
+
+FEATURES = ["gpa", "attendance_rate", "assignments_completed", "household_income_bracket", "parent_education_level"]
+FEATURE_DTYPES = {
+    "gpa": np.float32,
+    "attendance_rate": np.float32,
+    "assignments_completed": np.int8,
+    "household_income_bracket": np.int8,
+    "parent_education_level": np.int8,
+}
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Candidates searched by default; the first one is the historical production model
+DEFAULT_GRID = {
+    "n_estimators": [100],
+    "max_depth": [5, 10, None],
+    "min_samples_leaf": [1, 20],
+}
+
+def _compact(frame, labels):
+    """(features, labels) chunk in compact dtypes; rows missing a label or feature are dropped."""
+    labels = np.asarray(labels, dtype=np.float32)
+    keep = ~np.isnan(labels) & frame[FEATURES].notna().all(axis=1).to_numpy()
+    frame = frame.loc[keep]
+    features = {name: frame[name].to_numpy(dtype=dtype) for name, dtype in FEATURE_DTYPES.items()}
+    return features, labels[keep].astype(np.int8)
+
+def _frame_labels(frame):
+    """0/1 labels (NaN when unknown) from an at_risk or risk_level column, as in ingest."""
+    if ingest.LABEL_FIELD in frame.columns:
+        values = pd.to_numeric(frame[ingest.LABEL_FIELD], errors="coerce")
+        return values.where(values.isin([0, 1])).to_numpy(dtype=np.float32)
+    if "risk_level" in frame.columns:
+        mapping = {level: float(level in ingest.AT_RISK_LEVELS) for level in ingest.RISK_LEVELS}
+        return frame["risk_level"].astype(str).str.strip().str.capitalize().map(mapping).to_numpy(dtype=np.float32)
+    raise ValueError(f"No label column: expected '{ingest.LABEL_FIELD}' or 'risk_level'")
+
+def iter_csv(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    header = pd.read_csv(path, nrows=0).columns
+    label_column = ingest.LABEL_FIELD if ingest.LABEL_FIELD in header else "risk_level"
+    dtypes = {name: ("float32" if dtype == np.float32 else "Int8") for name, dtype in FEATURE_DTYPES.items()}
+    for frame in pd.read_csv(path, usecols=FEATURES + [label_column], dtype=dtypes, chunksize=chunk_size):
+        yield _compact(frame, _frame_labels(frame))
+
+def iter_parquet(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet training data requires pyarrow (pip install pyarrow)")
+    parquet = pq.ParquetFile(path)
+    names = set(parquet.schema_arrow.names)
+    label_column = ingest.LABEL_FIELD if ingest.LABEL_FIELD in names else "risk_level"
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=FEATURES + [label_column]):
+        frame = batch.to_pandas()
+        yield _compact(frame, _frame_labels(frame))
+
+def iter_db(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Labeled students, walked by primary key."""
+    import database, models
+
+    columns = [getattr(models.Student, name) for name in FEATURES]
+    db = database.SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = (
+                db.query(models.Student.id, models.Student.at_risk, *columns)
+                .filter(models.Student.id > last_id, models.Student.at_risk.isnot(None))
+                .order_by(models.Student.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            frame = pd.DataFrame(rows, columns=["id", "at_risk"] + FEATURES)
+            yield _compact(frame, frame["at_risk"].to_numpy(dtype=np.float32))
+    finally:
+        db.close()
+
+def iter_synthetic(rows=1000, chunk_size=DEFAULT_CHUNK_SIZE, seed=42):
+    """Noisy synthetic cohort (the generator the original ml/train_model.py used)."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - start)
+        gpa = rng.uniform(1.0, 4.0, n)
+        attendance = rng.uniform(0.5, 1.0, n)
+        assignments = rng.integers(0, 20, n)
+        risk_prob = (4.0 - gpa) / 3.0 * 0.4 + (1.0 - attendance) / 0.5 * 0.3 + (20 - assignments) / 20.0 * 0.3
+        risk_prob += rng.normal(0, 0.05, n)
+        frame = pd.DataFrame({
+            "gpa": gpa,
+            "attendance_rate": attendance,
+            "assignments_completed": assignments,
+            "household_income_bracket": rng.integers(1, 4, n),
+            "parent_education_level": rng.integers(1, 4, n),
+        })
+        yield _compact(frame, (risk_prob > 0.5).astype(np.int8))
+
+def load(chunks):
+    """Concatenate chunks into (X float32 (n, 5), y int8) without a pandas copy of the whole set."""
+    columns = {name: [] for name in FEATURES}
+    labels = []
+    for features, y in chunks:
+        for name in FEATURES:
+            columns[name].append(features[name])
+        labels.append(y)
+    if not labels:
+        raise ValueError("No labeled rows to train on")
+    # Stored compactly while loading; one float32 matrix (what the trees use) at the end
+    X = np.empty((sum(len(y) for y in labels), len(FEATURES)), dtype=np.float32)
+    for j, name in enumerate(FEATURES):
+        X[:, j] = np.concatenate(columns[name])
+        columns[name] = None
+    return X, np.concatenate(labels)
+
+def candidates(grid=DEFAULT_GRID):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+def _evaluate(y_true, y_prob):
+    y_pred = (y_prob >= 0.5).astype(np.int8)
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, zero_division=0)),
+        "f1_score": float(f1_score(y_true, y_pred, zero_division=0)),
+        "roc_auc": float(roc_auc_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else None,
+    }
+
+# Brackets reported separately so disparities between groups show up in review
+FAIRNESS_GROUPS = ["household_income_bracket", "parent_education_level"]
+CALIBRATION_BINS = 10
+
+def evaluation_report(y_true, y_prob, X, threshold=0.5):
+    """Confusion matrix, per-class scores, calibration curve and per-group metrics on a holdout."""
+    y_true = np.asarray(y_true, dtype=np.int8)
+    y_pred = (y_prob >= threshold).astype(np.int8)
+    tn, fp, fn, tp = (int(((y_true == t) & (y_pred == p)).sum()) for t, p in ((0, 0), (0, 1), (1, 0), (1, 1)))
+
+    per_class = {}
+    for label, name in ((0, "not_at_risk"), (1, "at_risk")):
+        per_class[name] = {
+            "precision": float(precision_score(y_true, y_pred, pos_label=label, zero_division=0)),
+            "recall": float(recall_score(y_true, y_pred, pos_label=label, zero_division=0)),
+            "f1_score": float(f1_score(y_true, y_pred, pos_label=label, zero_division=0)),
+            "support": int((y_true == label).sum()),
+        }
+
+    calibration = []
+    bins = np.minimum((y_prob * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    for b in range(CALIBRATION_BINS):
+        in_bin = bins == b
+        count = int(in_bin.sum())
+        calibration.append({
+            "bin_start": b / CALIBRATION_BINS,
+            "bin_end": (b + 1) / CALIBRATION_BINS,
+            "count": count,
+            "mean_predicted": float(y_prob[in_bin].mean()) if count else None,
+            "observed_rate": float(y_true[in_bin].mean()) if count else None,
+        })
+
+    by_group = {}
+    for name in FAIRNESS_GROUPS:
+        column = X[:, FEATURES.index(name)].astype(int)
+        by_group[name] = {}
+        for value in np.unique(column):
+            in_group = column == value
+            scores = _evaluate(y_true[in_group], y_prob[in_group])
+            by_group[name][str(value)] = {
+                **scores,
+                "count": int(in_group.sum()),
+                "positive_rate": float(y_true[in_group].mean()),
+                "predicted_positive_rate": float(y_pred[in_group].mean()),
+            }
+
+    return {
+        "threshold": threshold,
+        "brier_score": float(np.mean((y_prob - y_true) ** 2)),
+        "confusion_matrix": {"tn": tn, "fp": fp, "fn": fn, "tp": tp},
+        "per_class": per_class,
+        "calibration": calibration,
+        "by_group": by_group,
+    }
+
+def n_leaves(clf):
+    return int(sum(tree.tree_.n_leaves for tree in clf.estimators_))
+
+def _within_leaf_budget(result, n_folds):
+    # Folds train on (k-1)/k of the rows; the refit on all of them grows about that much more
+    return result["mean_n_leaves"] * n_folds / max(n_folds - 1, 1) <= explain.MAX_LEAVES
+
+def _cv_task(data_dir, params, fold, n_folds, seed, max_samples):
+    """Fit one candidate on one fold. Runs in a worker; data comes from a shared memory map."""
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+    splits = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y)
+    train_idx, test_idx = next(itertools.islice(splits, fold, None))
+    started = time.perf_counter()
+    clf = RandomForestClassifier(random_state=seed, n_jobs=1, max_samples=max_samples, **params)
+    clf.fit(X[train_idx], y[train_idx])
+    scores = _evaluate(y[test_idx], clf.predict_proba(X[test_idx])[:, 1])
+    return params, fold, {**scores, "n_leaves": n_leaves(clf)}, time.perf_counter() - started
+
+def cross_validate(X, y, grid=DEFAULT_GRID, n_folds=3, workers=None, seed=42, max_samples=None):
+    """Score every candidate with k-fold CV; all (candidate, fold) fits run in parallel."""
+    params_list = candidates(grid)
+    data_dir = tempfile.mkdtemp(prefix="earlywarn-train-")
+    try:
+        np.save(os.path.join(data_dir, "X.npy"), X)
+        np.save(os.path.join(data_dir, "y.npy"), y)
+        results = {json.dumps(p, sort_keys=True): {"params": p, "folds": []} for p in params_list}
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [
+                executor.submit(_cv_task, data_dir, params, fold, n_folds, seed, max_samples)
+                for params in params_list for fold in range(n_folds)
+            ]
+            for future in futures:
+                params, fold, scores, seconds = future.result()
+                results[json.dumps(params, sort_keys=True)]["folds"].append({"fold": fold, "seconds": seconds, **scores})
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    for result in results.values():
+        for metric in ("accuracy", "precision", "recall", "f1_score", "roc_auc", "n_leaves"):
+            values = [f[metric] for f in result["folds"] if f[metric] is not None]
+            result[f"mean_{metric}"] = float(np.mean(values)) if values else None
+    # Rank by ROC AUC (threshold-free), F1 as a tie-break
+    return sorted(
+        results.values(),
+        key=lambda r: (r["mean_roc_auc"] or 0.0, r["mean_f1_score"] or 0.0),
+        reverse=True,
+    )
+
+def train(X, y, grid=DEFAULT_GRID, n_folds=3, workers=None, n_jobs=-1, test_size=0.2, seed=42, max_samples=None):
+    """Select hyperparameters by CV on the training split, refit and evaluate on the holdout."""
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed, stratify=y)
+
+    t0 = time.perf_counter()
+    if len(candidates(grid)) > 1 and n_folds > 1:
+        cv_results = cross_validate(X_train, y_train, grid, n_folds, workers, seed, max_samples)
+        # Best candidate the Shapley explainer can still serve
+        eligible = [r for r in cv_results if _within_leaf_budget(r, n_folds)]
+        if not eligible:
+            print(f"No candidate fits the explainer's {explain.MAX_LEAVES} leaf budget; "
+                  "predictions will be explained by global importances.")
+        best = (eligible or cv_results)[0]["params"]
+    else:
+        cv_results = []
+        best = candidates(grid)[0]
+    cv_seconds = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    clf = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, max_samples=max_samples, **best)
+    clf.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - t1
+    # Served single-threaded; the service walks the flattened trees itself
+    clf.set_params(n_jobs=None)
+
+    y_prob = clf.predict_proba(X_test)[:, 1]
+    metrics = {
+        **_evaluate(y_test, y_prob),
+        **evaluation_report(y_test, y_prob, X_test),
+        "last_trained": pd.Timestamp.now().isoformat(),
+        "params": best,
+        "n_leaves": n_leaves(clf),
+        "n_train": int(len(y_train)),
+        "n_test": int(len(y_test)),
+        "positive_rate": float(y.mean()),
+        "cv_folds": n_folds,
+        "cv_results": cv_results,
+        "cv_seconds": cv_seconds,
+        "fit_seconds": fit_seconds,
+    }
+    return clf, metrics
+
+def publish(clf, metrics, grid_step=0.01, activate=True, reference=None):
+    """Write model, metrics, drift reference and risk grid into a staging dir and commit it as a version."""
+    output_dir = model_registry.stage()
+    try:
+        model_path = os.path.join(output_dir, model_registry.MODEL_FILE)
+        joblib.dump(clf, model_path)
+        try:
+            model_format.export(clf, model_format.flat_path(model_path), FEATURES, model_fingerprint(model_path))
+        except model_format.UnsupportedModel as e:
+            print(f"Flat model not written ({e}); the service will load the pickle.")
+        with open(os.path.join(output_dir, model_registry.METRICS_FILE), "w") as f:
+            json.dump(metrics, f, indent=2)
+        if reference is not None:
+            drift.save_reference(reference, output_dir)
+
+        if grid_step > 0:
+            # Precomputed risk grid for the service's optional grid mode, tied to this artifact
+            engine = FlatForest.from_sklearn(clf, feature_names=FEATURES)
+            table, header = build_grid(engine.predict_proba, gpa_step=grid_step, attendance_step=grid_step)
+            header["model_version"] = model_fingerprint(model_path)
+            save_grid(table, header, os.path.join(output_dir, "risk_grid"))
+            with open(os.path.join(output_dir, "risk_grid_report.json"), "w") as f:
+                json.dump(accuracy_report(engine.predict_proba), f, indent=2)
+
+        return model_registry.commit(output_dir, activate_version=activate)
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+def source_chunks(source, path=None, rows=1000, chunk_size=DEFAULT_CHUNK_SIZE, seed=42):
+    if source == "db":
+        return iter_db(chunk_size)
+    if source == "csv":
+        return iter_csv(path, chunk_size)
+    if source == "parquet":
+        return iter_parquet(path, chunk_size)
+    if source == "synthetic":
+        return iter_synthetic(rows, chunk_size, seed)
+    raise ValueError(f"Unknown source: {source}")
+
+def _parse_grid(text):
+    """'max_depth=5,10,None;min_samples_leaf=1,20' -> grid dict (merged over the default)."""
+    grid = dict(DEFAULT_GRID)
+    for part in filter(None, (p.strip() for p in (text or "").split(";"))):
+        name, values = part.split("=", 1)
+        grid[name.strip()] = [None if v.strip() == "None" else json.loads(v) for v in values.split(",")]
+    return grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and publish the at-risk model.")
+    parser.add_argument("--source", choices=["db", "csv", "parquet", "synthetic"], default="db")
+    parser.add_argument("--path", help="Input file for csv/parquet sources")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows for the synthetic source")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--grid", help="Hyperparameter grid, e.g. 'max_depth=5,10,None;min_samples_leaf=1,20'")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--workers", type=int, help="Processes for CV (default: all cores)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cores for the final fit")
+    parser.add_argument("--max-samples", type=float, help="Bootstrap sample fraction per tree (speeds up large sets)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--grid-step", type=float, default=float(os.getenv("GRID_STEP", "0.01")),
+                        help="Risk grid resolution; 0 skips the grid")
+    parser.add_argument("--no-activate", action="store_true", help="Register without serving it")
+    args = parser.parse_args(argv)
+    if args.source in ("csv", "parquet") and not args.path:
+        parser.error(f"--path is required for --source {args.source}")
+
+    t0 = time.perf_counter()
+    X, y = load(source_chunks(args.source, args.path, args.rows, args.chunk_size, args.seed))
+    load_seconds = time.perf_counter() - t0
+    print(f"Loaded {len(y):,} labeled rows ({(X.nbytes + y.nbytes) / 1e6:.1f} MB) in {load_seconds:.1f}s")
+    if len(np.unique(y)) < 2:
+        print("Error: Training data needs both at-risk and not-at-risk students")
+        sys.exit(1)
+
+    clf, metrics = train(
+        X, y, _parse_grid(args.grid), args.folds, args.workers, args.n_jobs, args.test_size, args.seed, args.max_samples,
+    )
+    metrics.update(source=args.source, load_seconds=load_seconds)
+
+    print("=" * 30)
+    print("MODEL PERFORMANCE")
+    print("=" * 30)
+    print(f"Params:    {metrics['params']}")
+    for name in ("accuracy", "precision", "recall", "f1_score", "roc_auc"):
+        if metrics[name] is not None:
+            print(f"{name:<10} {metrics[name]:.4f}")
+    print(f"CV {metrics['cv_seconds']:.1f}s, final fit {metrics['fit_seconds']:.1f}s")
+
+    reference = drift.build_reference(X, FEATURES)
+    version = publish(clf, metrics, args.grid_step, activate=not args.no_activate, reference=reference)
+    state = "Published" if not args.no_activate else "Registered (not active)"
+    print(f"{state} model version {version} to {model_registry.REGISTRY_DIR}")
+    return version
+
+if __name__ == "__main__":
+    main()
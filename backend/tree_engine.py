@@ -0,0 +1,117 @@
+import numpy as np
+
+class FlatForest:
+    """A tree ensemble flattened into contiguous NumPy arrays.
+
+    Every tree of the forest is stored in the same node arrays; `roots` holds the
+    index of each tree's root. Leaves point to themselves and carry an infinite
+    threshold, so all trees can be walked in lock-step for `max_depth` steps
+    without any per-tree Python code.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value", "cover", "roots", "children")
+
+    def __init__(self, feature, threshold, left, right, value, cover, roots, max_depth, feature_names, children=None):
+        self.feature = feature          # int32, split feature per node
+        self.threshold = threshold      # float64, go left if x <= threshold
+        self.left = left                # int32, left child per node
+        self.right = right              # int32, right child per node
+        self.value = value              # float64, P(class 1) per node
+        self.cover = cover              # float64, weighted training samples per node
+        self.roots = roots              # int32, root node per tree
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names)
+        # children[2 * node + go_left] -> next node, one gather per level
+        self._children = np.stack([right, left], axis=1).ravel() if children is None else children
+        self._row_arrays = None  # intp copies for `_apply_row`, made on first use
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def is_leaf(self):
+        return self.left == np.arange(len(self.left))
+
+    def arrays(self):
+        """The node arrays by name, as stored by `model_format`."""
+        return {name: getattr(self, name) for name in self.ARRAYS[:-1]} | {"children": self._children}
+
+    @classmethod
+    def from_arrays(cls, arrays, max_depth, feature_names):
+        """Rebuild from `arrays()` output without copying (arrays may be memory-mapped)."""
+        return cls(max_depth=max_depth, feature_names=feature_names, **{name: arrays[name] for name in cls.ARRAYS})
+
+    @classmethod
+    def from_sklearn(cls, model, feature_names=None, positive_class=1):
+        """Flatten a fitted scikit-learn forest (or single tree) classifier."""
+        estimators = getattr(model, "estimators_", [model])
+        class_index = list(model.classes_).index(positive_class)
+        if feature_names is None:
+            feature_names = getattr(model, "feature_names_in_", range(model.n_features_in_))
+
+        features, thresholds, lefts, rights, values, covers, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n = tree.node_count
+            own = np.arange(n) + offset
+            leaf = tree.children_left == -1
+
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, own, tree.children_left + offset))
+            rights.append(np.where(leaf, own, tree.children_right + offset))
+            # Older scikit-learn stores class counts, newer stores fractions
+            counts = tree.value[:, 0, :]
+            values.append(counts[:, class_index] / counts.sum(axis=1))
+            covers.append(tree.weighted_n_node_samples)
+            roots.append(offset)
+
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.int32),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.int32),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            cover=np.ascontiguousarray(np.concatenate(covers), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=[str(name) for name in feature_names],
+        )
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_rows, n_trees)."""
+        # scikit-learn evaluates splits on float32 inputs; do the same so that
+        # values sitting exactly on a threshold fall on the same side.
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            return self._apply_row(X)[np.newaxis, :]
+
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = flat.take(row_offsets + self.feature.take(nodes)) <= self.threshold.take(nodes)
+            nodes = self._children.take((nodes << 1) | go_left)
+        return nodes
+
+    def _apply_row(self, x):
+        # With a single row every level is a handful of gathers over n_trees
+        # nodes, and converting int32 indices to intp on each one is a large
+        # share of the cost, so the walk uses intp copies of the index arrays.
+        if self._row_arrays is None:
+            self._row_arrays = tuple(a.astype(np.intp) for a in (self.roots, self.feature, self._children))
+        nodes, feature, children = self._row_arrays
+        for _ in range(self.max_depth):
+            go_left = x.take(feature.take(nodes)) <= self.threshold.take(nodes)
+            nodes = children.take((nodes << 1) | go_left)
+        return nodes
+
+    def predict_proba(self, X):
+        """Probability of the positive class, averaged over trees (like sklearn)."""
+        return self.value.take(self.apply(X)).mean(axis=1)
@@ -1,16 +1,35 @@
+import os
+import sys
 import joblib
 import pandas as pd
 import numpy as np
 
+# The flat model format lives with the service
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend'))
+import model_format
+from risk_grid import model_fingerprint
+
 MODEL_PATH = "ml/model.pkl"
-# Load model globally to avoid reloading on every request in production
+FLAT_MODEL_PATH = "ml/model.flat"  # written by backend/model_format.py
+# Load model globally to avoid reloading on every request in production.
+# The flat file is memory-mapped, so processes share it; pickle is the fallback.
+model = None
+flat_model = None
 try:
-    model = joblib.load(MODEL_PATH)
-except FileNotFoundError:
-    print(f"Warning: Model not found at {MODEL_PATH}. Using mock prediction.")
-    model = None
+    flat_model = model_format.load(FLAT_MODEL_PATH, explainer=False)
+    if flat_model.fingerprint != model_fingerprint(MODEL_PATH):
+        flat_model = None
+except (OSError, ValueError):
+    flat_model = None
+if flat_model is None:
+    try:
+        model = joblib.load(MODEL_PATH)
+    except FileNotFoundError:
+        print(f"Warning: Model not found at {MODEL_PATH}. Using mock prediction.")
 
 def get_prediction(gpa, attendance, assignments, income, education):
+    if flat_model is not None:
+        return float(flat_model.forest.predict_proba(np.array([gpa, attendance, assignments, income, education]))[0])
     if model is None:
         # Mock logic
         return 0.5 # Default Medium Risk
@@ -30,9 +49,11 @@ def get_prediction(gpa, attendance, assignments, income, education):
 def get_explainability(features):
     # Dummy explainability for now (could use SHAP in future)
     # Using simple feature importance from random forest
-    if model is None:
+    if flat_model is not None:
+        importances = list(flat_model.importances.values())
+    elif model is None:
         return {}
-    
-    importances = model.feature_importances_
+    else:
+        importances = model.feature_importances_
     names = ['GPA', 'Attendance', 'Assignments', 'Income', 'Education']
     return dict(zip(names, importances))